@@ -1,9 +1,96 @@
+import json
 import random
+import time
+from array import array
+import ChessBook
+import ChessEngine
+import ChessEval
+import ChessTablebase
 
 pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1} #dictionary to store the value of each piece
-CHECKMATE = 1000 #checkmate score, highest possible score 
+CHECKMATE = 100000 #checkmate score, highest possible score, well above any material count in centipawns
+MATE_BOUND = CHECKMATE - 1000 #scores beyond this are forced mates: a mate the given number of plies from the root scores CHECKMATE - plies
 STALEMATE = 0 #stalemate score, lowest possible score
-DEPTH = 3 #depth of the recursive function, if you have difficulty settings, you can change this value
+DEPTH = 3 #deepest iteration findBestMove will search, the time and node budgets usually stop it earlier
+MAX_DEPTH = 32 #depth cap used when only the time budget should limit the search
+TIME_LIMIT = 2.0 #seconds per move for findBestMove, None for no time limit
+NODE_LIMIT = None #nodes per move for findBestMove, None for no node limit
+MAX_PLY = 64 #deepest ply the killer move table keeps track of
+DELTA_PRUNING = True #skip quiescence captures that can't raise alpha even with a safety margin
+DELTA_MARGIN = 200 #safety margin for delta pruning, in centipawns
+#difficulty -> (seconds per move, deepest iteration). Easy and medium keep their old depths, the time budget caps how long any move can take
+DIFFICULTY_LEVELS = {"easy": (0.5, 1), "medium": (1.0, 2), "hard": (3.0, MAX_DEPTH)}
+USE_BOOK = True #play from the opening book (ChessBook.BOOK_FILE) while the position is in it, instead of searching
+USE_TABLEBASES = True #play and score endings of ChessTablebase.MAX_PIECES pieces or fewer from the tablebases that have been generated
+SEARCH_WORKERS = 1 #processes findBestMove splits the root moves over, 1 searches in this process (os.cpu_count() uses every core)
+SEARCH_LOG = None #JSON-lines file the report of every findBestMove call is appended to, None for no log
+PROFILE_SEARCH = False #time move generation and evaluation for the search report, which slows the search down a little
+TT_SIZE_MB = 16 #memory cap for the transposition table, keep it small when running many engines on one machine
+EXACT, LOWERBOUND, UPPERBOUND = 1, 2, 3 #what a stored score means: the real score, at least this (beta cutoff) or at most this (no move raised alpha)
+
+'''
+Fixed size transposition table. Every entry is spread over flat arrays (key, score, depth, bound, best move, search age)
+so the memory used is known up front. A slot is replaced when it holds a shallower search of another position or is left over from an earlier search
+'''
+class TranspositionTable():
+    ENTRY_BYTES = 8 + 4 + 1 + 1 + 4 + 1 #key, score, depth, bound, move, age
+
+    def __init__(self, sizeMB=TT_SIZE_MB):
+        entries = max(1, int(sizeMB * 1024 * 1024) // self.ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1) #round down to a power of two so the index is just a mask
+        self.mask = self.size - 1
+        self.keys = array('Q', [0]) * self.size
+        self.scores = array('i', [0]) * self.size
+        self.depths = array('b', [0]) * self.size
+        self.bounds = array('B', [0]) * self.size #0 means the slot is empty
+        self.moves = array('i', [-1]) * self.size #moveID of the best move, -1 if there isn't one
+        self.ages = array('B', [0]) * self.size
+        self.age = 0
+
+    '''
+    Call once per search, so entries from earlier searches can be replaced first
+    '''
+    def newSearch(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def clear(self):
+        for table in (self.keys, self.scores, self.depths, self.bounds, self.ages):
+            table[:] = array(table.typecode, [0]) * self.size
+        self.moves[:] = array('i', [-1]) * self.size
+
+    '''
+    Look up a position. Returns (score, bound, depth, moveID) or None if the position is not stored
+    '''
+    def probe(self, key):
+        i = key & self.mask
+        if self.bounds[i] and self.keys[i] == key:
+            return self.scores[i], self.bounds[i], self.depths[i], self.moves[i]
+        return None
+
+    def store(self, key, depth, score, bound, moveID):
+        i = key & self.mask
+        if self.bounds[i] and self.keys[i] != key and self.ages[i] == self.age and self.depths[i] > depth:
+            return #depth preferred, keep the deeper result from this search
+        if moveID == -1 and self.keys[i] == key:
+            moveID = self.moves[i] #keep the old best move rather than forgetting it
+        self.keys[i] = key
+        self.scores[i] = score
+        self.depths[i] = depth
+        self.bounds[i] = bound
+        self.moves[i] = moveID
+        self.ages[i] = self.age
+
+transpositionTable = None #created on the first search so importing ChessAI stays cheap
+
+'''
+The shared transposition table, created with TT_SIZE_MB the first time it is needed
+'''
+def getTranspositionTable():
+    global transpositionTable
+    if transpositionTable is None:
+        transpositionTable = TranspositionTable(TT_SIZE_MB)
+    return transpositionTable
+
 '''
 Pick a random move from the list of valid moves
 '''
@@ -49,15 +136,364 @@ def findBestMoveMinMaxNoRecursion(gs, validMoves): #depth is 2
     return bestPlayerMove
 
 '''
-helper method to make the first recursive call
+helper method to make the first recursive call, unless the opening book has a move. With more than one worker the root moves are searched in parallel processes.
+stop is an optional threading.Event, setting it from another thread stops the search like a timeout (None if no iteration finished).
+ponderHit is an optional threading.Event for pondering on the opponent's time: the time limit doesn't run until it is set,
+then it counts from the start of the search. A ponder search always runs in this process.
+With report=True it returns (move, search report), see searchReport. The report also goes to SEARCH_LOG if that is set
 '''
-def findBestMove(gs, validMoves):
-    global nextMove
-    nextMove = None 
+def findBestMove(gs, validMoves, timeLimit=None, nodeLimit=None, workers=None, stop=None, ponderHit=None, report=False):
+    move, searchReport = searchBestMove(gs, validMoves, timeLimit, nodeLimit, workers, stop, ponderHit)
+    if SEARCH_LOG is not None and searchReport is not None:
+        with open(SEARCH_LOG, "a") as f:
+            f.write(json.dumps(searchReport) + "\n")
+    return (move, searchReport) if report else move
+
+'''
+Pick the move for findBestMove: from the book, the tablebases or a search. Returns (move, search report)
+'''
+def searchBestMove(gs, validMoves, timeLimit, nodeLimit, workers, stop, ponderHit):
+    if len(validMoves) == 0:
+        return None, None
+    start = time.perf_counter()
+    fen = gs.getFEN()
+    if USE_BOOK:
+        bookMove = ChessBook.getBookMove(gs, validMoves)
+        if bookMove is not None: #a book move needs no search
+            return bookMove, searchReport(gs, validMoves, bookMove, "book", fen, [], None, time.perf_counter() - start)
+    if USE_TABLEBASES and gs.pieceCount <= ChessTablebase.MAX_PIECES:
+        tablebaseMove = ChessTablebase.getTablebaseMove(gs, validMoves)
+        if tablebaseMove is not None: #the tablebase knows the result of every move
+            return tablebaseMove, searchReport(gs, validMoves, tablebaseMove, "tablebase", fen, [], None, time.perf_counter() - start)
     random.shuffle(validMoves) #shuffle the valid moves to randomize the order of the moves to prevent the AI from making the same moves every time
-    #findMoveMinMax(gs, validMoves, DEPTH, 1 if gs.whiteToMove else -1) #call the recursive function to find the best move
-    findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH,-CHECKMATE,CHECKMATE, 1 if gs.whiteToMove else -1) #call the recursive function to find the best move, instead of the function findMoveMinMax
-    return nextMove
+    timeLimit = TIME_LIMIT if timeLimit is None else timeLimit
+    nodeLimit = NODE_LIMIT if nodeLimit is None else nodeLimit
+    workers = SEARCH_WORKERS if workers is None else workers
+    if workers > 1 and len(validMoves) > 1 and ponderHit is None:
+        move, iterations, stats = findBestMoveParallel(gs, validMoves, timeLimit, nodeLimit, workers, stop)
+        source = "parallel search"
+    else:
+        iterations = searchIterations(gs, validMoves, timeLimit, nodeLimit, DEPTH, stop, ponderHit)
+        move = iterations[-1][2] if iterations else None
+        stats = searchStats()
+        source = "search"
+    if move is None:
+        return None, None
+    return move, searchReport(gs, validMoves, move, source, fen, iterations, stats, time.perf_counter() - start)
+
+'''
+The search report of a findBestMove call, a dict that can be written as JSON:
+    move, source ("book", "tablebase", "search" or "parallel search"), fen, seconds,
+    depth, score (centipawns for the side to move), pv (principal variation in SAN, from the transposition table),
+    nodes, quiescenceNodes, nps, cutoffRate (beta cutoffs per node that searched moves), firstMoveCutoffRate (cutoffs on the first move),
+    ebf (effective branching factor, nodes of the last iteration over the one before), ttHitRate, tablebaseHits,
+    moveGenSeconds and evalSeconds (None unless PROFILE_SEARCH is on) and iterations (depth, score, move, nodes and seconds of each).
+Rates are None when there was nothing to divide by
+'''
+def searchReport(gs, validMoves, move, source, fen, iterations, stats, seconds):
+    def rate(part, whole):
+        return round(part / whole, 4) if whole else None
+    stats = stats or dict.fromkeys(SEARCH_STATS, 0)
+    iterationNodes = [iteration[3] - (iterations[i - 1][3] if i > 0 else 0) for i, iteration in enumerate(iterations)]
+    depth = iterations[-1][0] if iterations else 0
+    return {"move": move.getSAN(validMoves), "source": source, "fen": fen, "seconds": round(seconds, 4),
+            "depth": depth, "score": iterations[-1][1] if iterations else None,
+            "pv": principalVariation(gs, move, max(depth, 1)),
+            "nodes": stats["nodes"], "quiescenceNodes": stats["quiescenceNodes"], "nps": round(stats["nodes"] / seconds) if seconds > 0 else None,
+            "cutoffRate": rate(stats["cutoffs"], stats["expandedNodes"]), "firstMoveCutoffRate": rate(stats["firstMoveCutoffs"], stats["cutoffs"]),
+            "ebf": rate(iterationNodes[-1], iterationNodes[-2]) if len(iterationNodes) > 1 else None,
+            "ttHitRate": rate(stats["ttHits"], stats["ttProbes"]), "tablebaseHits": stats["tablebaseHits"],
+            "moveGenSeconds": round(stats["moveGenSeconds"], 4) if PROFILE_SEARCH else None,
+            "evalSeconds": round(stats["evalSeconds"], 4) if PROFILE_SEARCH else None,
+            "iterations": [{"depth": d, "score": score, "move": m.getSAN(validMoves), "nodes": nodes, "seconds": round(t, 4)}
+                           for d, score, m, nodes, t in iterations]}
+
+'''
+The line the search expects, as a list of SAN moves: move, then the best moves the transposition table has for the positions after it
+'''
+def principalVariation(gs, move, maxLength):
+    table = getTranspositionTable()
+    pv = []
+    seen = {gs.zobristKey}
+    validMoves = gs.getValidMoves()
+    while move is not None and len(pv) < maxLength:
+        pv.append(move.getSAN(validMoves))
+        gs.makeMove(move)
+        if gs.zobristKey in seen: #a repetition would go round forever
+            break
+        seen.add(gs.zobristKey)
+        validMoves = gs.getValidMoves()
+        entry = table.probe(gs.zobristKey)
+        move = next((m for m in validMoves if m.moveID == entry[3]), None) if entry is not None else None
+    for i in range(len(pv)):
+        gs.undoMove()
+    return pv
+
+'''
+Iterative deepening, search 1 ply, then 2, then 3... up to maxDepth until we run out of time or nodes.
+Returns the completed iterations as a list of (depth, score, best move, nodes, seconds), score from the side to move's point of view,
+nodes and seconds counted from the start of the search
+'''
+def searchIterations(gs, validMoves, timeLimit, nodeLimit, maxDepth, stop=None, ponderHit=None):
+    global nextMove, searchDeadline, searchNodeLimit, searchDepth, searchStop, searchPonderHit, searchPonderDeadline
+    nextMove = None
+    searchStop = stop
+    getTranspositionTable().newSearch()
+    clearMoveOrdering()
+    searchNodeLimit = nodeLimit
+    searchDeadline = time.perf_counter() + timeLimit if timeLimit else None
+    searchPonderHit = ponderHit
+    if ponderHit is not None: #pondering, the clock only starts once the opponent plays the predicted move
+        searchPonderDeadline = searchDeadline
+        searchDeadline = None
+    resetSearchStats()
+    movesMade = len(gs.moveLog)
+    start = time.perf_counter()
+    iterations = []
+    for searchDepth in range(1, maxDepth + 1):
+        try:
+            #findMoveMinMax(gs, validMoves, DEPTH, 1 if gs.whiteToMove else -1) #call the recursive function to find the best move
+            score = findMoveNegaMaxAlphaBeta(gs, validMoves, searchDepth, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1) #call the recursive function to find the best move, instead of the function findMoveMinMax
+        except SearchTimeout:
+            while len(gs.moveLog) > movesMade: #the search stopped in the middle of the tree, take back the moves it made
+                gs.undoMove()
+            break
+        iterations.append((searchDepth, score, nextMove, searchNodes, time.perf_counter() - start))
+        validMoves.remove(nextMove) #search the best move first in the next iteration
+        validMoves.insert(0, nextMove)
+        if isMateScore(score): #a forced mate was found, searching deeper won't change the move
+            break
+    return iterations
+
+'''
+The move the opponent is expected to play next: the best move the transposition table has for this position, None if there isn't one.
+Right after findBestMove this is usually the reply the search expected to its own move
+'''
+def predictMove(gs, validMoves):
+    entry = getTranspositionTable().probe(gs.zobristKey)
+    if entry is None or entry[3] == -1:
+        return None
+    return next((move for move in validMoves if move.moveID == entry[3]), None)
+
+searchPool = None #process pool of the parallel search, kept between moves so the workers keep their transposition tables
+searchPoolWorkers = 0
+searchPoolCancel = None #multiprocessing.Event shared with the workers of searchPool, set to stop the searches they are running
+workerCancel = None #the same event on the worker side, the stop event of every searchRootMoves call
+
+'''
+The process pool for the parallel search, started the first time it is needed and restarted when the worker count changes
+'''
+def getSearchPool(workers):
+    global searchPool, searchPoolWorkers, searchPoolCancel
+    if searchPool is None or searchPoolWorkers != workers:
+        import multiprocessing #imported here, multiprocessing would double the import time of ChessAI
+        from concurrent.futures import ProcessPoolExecutor
+        shutdownSearchPool()
+        searchPoolCancel = multiprocessing.Event() #handed over when the workers start, an Event can't be passed to submit
+        searchPool = ProcessPoolExecutor(max_workers=workers, initializer=initSearchWorker, initargs=(searchPoolCancel,))
+        searchPoolWorkers = workers
+    return searchPool
+
+'''
+Runs once in every worker process of the search pool
+'''
+def initSearchWorker(cancel):
+    global workerCancel
+    workerCancel = cancel
+
+'''
+Stop the worker processes of the parallel search, if there are any
+'''
+def shutdownSearchPool():
+    global searchPool
+    if searchPool is not None:
+        searchPoolCancel.set() #don't wait for the searches still running to use up their budget
+        searchPool.shutdown(cancel_futures=True)
+        searchPool = None
+
+'''
+Root-parallel search: the root moves are dealt out over the workers like cards, so every worker gets some of the likely good ones.
+Workers get the position as a FEN string with the keys of the positions before it and the moveIDs to search, never the GameState itself. A node budget is split between them.
+Every worker's best move is taken from the deepest iteration that worker finished, so a slow worker doesn't throw away the deeper results of the others.
+The best score wins, then the deeper search, then the earlier move in validMoves, so the same worker results always give the same move.
+When stop is set the queued jobs are cancelled and the running ones are stopped before returning, so the next search doesn't wait behind them.
+Returns (move, [(depth, score, move, nodes, seconds)], search statistics of all workers added up)
+'''
+def findBestMoveParallel(gs, validMoves, timeLimit, nodeLimit, workers, stop=None):
+    workers = min(workers, len(validMoves))
+    fen = gs.getFEN()
+    workerNodeLimit = max(1, nodeLimit // workers) if nodeLimit else nodeLimit
+    pool = getSearchPool(workers)
+    history = gs.getRepetitionHistory()
+    futures = [pool.submit(searchRootMoves, gs.backend, fen, [move.moveID for move in validMoves[i::workers]], timeLimit, workerNodeLimit, DEPTH, history) for i in range(workers)]
+    from concurrent.futures import wait
+    while wait(futures, timeout=0.05).not_done:
+        if stop is not None and stop.is_set():
+            searchPoolCancel.set()
+            for future in futures:
+                future.cancel() #jobs that haven't started yet
+            wait(futures) #the running ones see the event within a few hundred nodes
+            searchPoolCancel.clear()
+            return None, [], None
+    results = [future.result()[0] for future in futures]
+    stats = {name: sum(future.result()[1][name] for future in futures) for name in SEARCH_STATS}
+    order = {move.moveID: i for i, move in enumerate(validMoves)}
+    best = None
+    for iterations in results:
+        depth, score, moveID = iterations[-1][:3]
+        candidate = (score, depth, -order[moveID])
+        if best is None or candidate > best:
+            best = candidate
+    score, depth, index = best
+    move = validMoves[-index]
+    return move, [(depth, score, move, stats["nodes"], max(iterations[-1][4] for iterations in results))], stats
+
+'''
+Worker side of the parallel search: set up the position from its FEN and repetition history and search only the given root moves.
+Returns (the completed iterations as (depth, score, moveID, nodes, seconds), searchStats())
+'''
+def searchRootMoves(backend, fen, moveIDs, timeLimit, nodeLimit, maxDepth, history=()):
+    ChessEngine.BACKEND = backend
+    gs = ChessEngine.newGameState()
+    gs.loadFEN(fen)
+    gs.setRepetitionHistory(history)
+    movesByID = {move.moveID: move for move in gs.getValidMoves()}
+    moves = [movesByID[moveID] for moveID in moveIDs]
+    iterations = searchIterations(gs, moves, timeLimit, nodeLimit, maxDepth, workerCancel)
+    return [(depth, score, move.moveID, nodes, seconds) for depth, score, move, nodes, seconds in iterations], searchStats()
+
+'''
+Raised inside the search when the time or node budget of findBestMove runs out
+'''
+class SearchTimeout(Exception):
+    pass
+
+searchDeadline = None #time.perf_counter() value at which the running search has to stop, None for no time limit
+searchNodeLimit = None
+searchNodes = 0 #nodes visited by the running search, including the quiescence nodes
+searchQuiescenceNodes = 0 #the part of searchNodes visited by quiescenceSearch
+searchExpandedNodes = 0 #findMoveNegaMaxAlphaBeta nodes that searched at least one move
+searchCutoffs = 0 #beta cutoffs in findMoveNegaMaxAlphaBeta
+searchFirstMoveCutoffs = 0 #the part of searchCutoffs caused by the first move searched
+searchTTProbes = 0
+searchTTHits = 0 #probes that found an entry for the position
+searchTablebaseHits = 0
+searchMoveGenTime = 0.0 #seconds spent generating and ordering moves, only counted with PROFILE_SEARCH
+searchEvalTime = 0.0 #seconds spent in scoreBoard, only counted with PROFILE_SEARCH
+SEARCH_STATS = ["nodes", "quiescenceNodes", "expandedNodes", "cutoffs", "firstMoveCutoffs", "ttProbes", "ttHits", "tablebaseHits", "moveGenSeconds", "evalSeconds"]
+searchDepth = DEPTH #depth of the iteration being searched
+searchStop = None #threading.Event that cancels the running search when set, None if it can't be cancelled
+searchPonderHit = None #threading.Event of a ponder search that hasn't been hit yet
+searchPonderDeadline = None #searchDeadline of the ponder search, used once searchPonderHit is set
+
+def resetSearchStats():
+    global searchNodes, searchQuiescenceNodes, searchExpandedNodes, searchCutoffs, searchFirstMoveCutoffs, searchTTProbes, searchTTHits, searchTablebaseHits, searchMoveGenTime, searchEvalTime
+    searchNodes = searchQuiescenceNodes = searchExpandedNodes = searchCutoffs = searchFirstMoveCutoffs = 0
+    searchTTProbes = searchTTHits = searchTablebaseHits = 0
+    searchMoveGenTime = searchEvalTime = 0.0
+
+'''
+The counters of the last search as a dict with the SEARCH_STATS names
+'''
+def searchStats():
+    return dict(zip(SEARCH_STATS, (searchNodes, searchQuiescenceNodes, searchExpandedNodes, searchCutoffs, searchFirstMoveCutoffs,
+                                   searchTTProbes, searchTTHits, searchTablebaseHits, searchMoveGenTime, searchEvalTime)))
+
+'''
+Hand out the moves of a staged generator, adding the time spent producing each one to searchMoveGenTime
+'''
+def timeMoveGeneration(moves):
+    global searchMoveGenTime
+    moves = iter(moves)
+    while True:
+        start = time.perf_counter()
+        move = next(moves, None)
+        searchMoveGenTime += time.perf_counter() - start
+        if move is None:
+            return
+        yield move
+
+'''
+scoreBoard, adding the time it takes to searchEvalTime
+'''
+def timeScoreBoard(gs):
+    global searchEvalTime
+    start = time.perf_counter()
+    score = scoreBoard(gs)
+    searchEvalTime += time.perf_counter() - start
+    return score
+
+'''
+Count a node and stop the search once the budget is used up. The first iteration always completes so there is a move to play,
+unless the search is cancelled through searchStop
+'''
+def checkSearchBudget():
+    global searchNodes, searchDeadline, searchPonderHit
+    searchNodes += 1
+    if searchStop is not None and searchNodes & 255 == 0 and searchStop.is_set():
+        raise SearchTimeout()
+    if searchPonderHit is not None and searchNodes & 255 == 0 and searchPonderHit.is_set(): #the opponent played the predicted move, the clock starts
+        searchDeadline = searchPonderDeadline
+        searchPonderHit = None
+    if searchDepth > 1:
+        if searchNodeLimit is not None and searchNodes > searchNodeLimit:
+            raise SearchTimeout()
+        if searchDeadline is not None and searchNodes & 255 == 0 and time.perf_counter() > searchDeadline: #reading the clock every node is too slow
+            raise SearchTimeout()
+
+attackerOrder = {"p": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6} #least valuable attacker first when two captures take the same piece
+killerMoves = [[-1, -1] for i in range(MAX_PLY)] #moveIDs of the two latest quiet moves that caused a beta cutoff at each ply
+historyScores = {} #(pieceMoved, endRow, endCol) -> how often that quiet move caused a cutoff, weighted by depth
+
+'''
+Forget the killer moves and history scores of the previous search
+'''
+def clearMoveOrdering():
+    global historyScores
+    for killers in killerMoves:
+        killers[0] = killers[1] = -1
+    historyScores = {}
+
+'''
+Sort the moves so the ones most likely to cause a cutoff come first: the transposition table move, then captures
+by most valuable victim / least valuable attacker (MVV-LVA) and promotions, then the killer moves, then quiet moves by history score.
+The sort is stable, so moves that score the same keep their (shuffled) order
+'''
+def orderMoves(moves, ply, hashMoveID):
+    killers = killerMoves[ply] if ply < MAX_PLY else (-1, -1)
+    def moveOrderScore(move):
+        if move.moveID == hashMoveID:
+            return 1000000
+        if move.pieceCaptured != "--" or move.isPawnPromotion:
+            score = 100000 + 100 * pieceScore[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 100000
+            if move.isPawnPromotion:
+                score += 100 * pieceScore["Q"]
+            return score - attackerOrder[move.pieceMoved[1]]
+        if move.moveID == killers[0]:
+            return 90000
+        if move.moveID == killers[1]:
+            return 80000
+        return historyScores.get((move.pieceMoved, move.endRow, move.endCol), 0)
+    moves.sort(key=moveOrderScore, reverse=True)
+
+'''
+Remember a quiet move that caused a beta cutoff, as a killer for this ply and in the history table
+'''
+def recordCutoff(move, depth, ply):
+    if move.pieceCaptured != "--" or move.isPawnPromotion: #captures are already ordered first
+        return
+    if ply < MAX_PLY and killerMoves[ply][0] != move.moveID:
+        killerMoves[ply][1] = killerMoves[ply][0]
+        killerMoves[ply][0] = move.moveID
+    historyKey = (move.pieceMoved, move.endRow, move.endCol)
+    historyScores[historyKey] = historyScores.get(historyKey, 0) + depth * depth #cutoffs close to the root count more
+
+'''
+Pick the time budget and depth cap for a difficulty level from DIFFICULTY_LEVELS
+'''
+def setDifficulty(level):
+    global TIME_LIMIT, DEPTH
+    TIME_LIMIT, DEPTH = DIFFICULTY_LEVELS[level]
 
 '''
 Recursive function to find the best move for the current player utilizing MinMax
@@ -111,32 +547,187 @@ def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
     return maxScore
 
 '''
-Recursive function to find the best move for the current player utilizing MinMax with Alpha Beta Pruning
+Recursive function to find the best move for the current player utilizing MinMax with Alpha Beta Pruning.
+The root is given its list of valid moves, every other node passes None and generates its moves with gs.getStagedMoves
 '''
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier): #alpha is the best score that the maximizing player can guarantee at that level or above, beta is the best score that the minimizing player can guarantee at that level or above
-    global nextMove
-    if depth == 0: #if we have reached the depth limit
+def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier, ply=0): #alpha is the best score that the maximizing player can guarantee at that level or above, beta is the best score that the minimizing player can guarantee at that level or above
+    global nextMove, searchTTProbes, searchTTHits, searchExpandedNodes, searchCutoffs, searchFirstMoveCutoffs
+    if validMoves is not None and len(validMoves) == 0: #the game is over
+        checkSearchBudget()
         return turnMultiplier * scoreBoard(gs) #return the score of the board
-    
-    #move ordering - implement later 
-    maxScore = -CHECKMATE
-    for move in validMoves:
+    if ply != 0 and isSearchDraw(gs): #a draw whatever is below, cut the subtree off
+        checkSearchBudget()
+        return STALEMATE
+    if depth == 0: #if we have reached the depth limit, play out the captures before scoring the board
+        return quiescenceSearch(gs, alpha, beta, turnMultiplier, ply)
+    checkSearchBudget()
+    if ply != 0:
+        tablebaseScore = probeTablebase(gs, ply)
+        if tablebaseScore is not None: #exact result, nothing below this node needs searching
+            return tablebaseScore
+    #a transposition searched at least as deep can answer this node, but the root still has to pick nextMove
+    table = getTranspositionTable()
+    entry = table.probe(gs.zobristKey)
+    searchTTProbes += 1
+    if entry is not None:
+        searchTTHits += 1
+    if entry is not None and entry[2] >= depth and ply != 0:
+        score, bound = scoreFromTable(entry[0], ply), entry[1]
+        if bound == EXACT:
+            return score
+        elif bound == LOWERBOUND and score > alpha:
+            alpha = score
+        elif bound == UPPERBOUND and score < beta:
+            beta = score
+        if alpha >= beta:
+            return score
+    alphaOrig = alpha
+    hashMoveID = entry[3] if entry is not None else -1
+    if validMoves is None: #generate the moves stage by stage, a cutoff on an early move saves generating the quiet moves
+        moves = gs.getStagedMoves(hashMoveID, lambda stage: orderMoves(stage, ply, hashMoveID))
+        if PROFILE_SEARCH:
+            moves = timeMoveGeneration(moves)
+    else:
+        orderMoves(validMoves, ply, hashMoveID) #try the moves most likely to cause a cutoff first
+        moves = validMoves
+    maxScore = -CHECKMATE - 1 #below any real score, so a best move is picked even when every move gets mated
+    bestMove = None
+    movesSearched = 0
+    for move in moves:
+        movesSearched += 1
         gs.makeMove(move)  
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -beta, -alpha, -turnMultiplier) #negative because we are looking at the opponent's score, whatever is best score for opponent is worst score for us
+        score = -findMoveNegaMaxAlphaBeta(gs, None, depth-1, -beta, -alpha, -turnMultiplier, ply+1) #negative because we are looking at the opponent's score, whatever is best score for opponent is worst score for us
         if score > maxScore: #based on maximizing the score, if the score is greater than the maxScore, then update the maxScore and the nextMove
             maxScore = score
-            if depth == DEPTH: 
+            bestMove = move
+            if ply == 0: #the root picks the move to play
                 nextMove = move
         gs.undoMove() 
         #alpha beta pruning
         if maxScore > alpha: #if the maximizing player has found a move that is better than the best move the minimizing player has available, then update the best move the minimizing player has available
             alpha = maxScore
         if alpha >= beta: #if the maximizing player has found a move that is as good as or better than the best move the minimizing player has available, then break
+            searchCutoffs += 1
+            if movesSearched == 1:
+                searchFirstMoveCutoffs += 1
+            recordCutoff(move, depth, ply)
             break #we won't look at any more moves  
+    if bestMove is None: #no legal moves, the game is over
+        maxScore = -(CHECKMATE - ply) if gs.inCheck() else STALEMATE #a mate closer to the root scores higher for the winner
+    else:
+        searchExpandedNodes += 1
+    if maxScore <= alphaOrig:
+        bound = UPPERBOUND
+    elif maxScore >= beta:
+        bound = LOWERBOUND
+    else:
+        bound = EXACT
+    table.store(gs.zobristKey, depth, scoreToTable(maxScore, ply), bound, bestMove.moveID if bestMove is not None else -1)
     return maxScore  
 '''
-Score the board based on the game state, a positive score is good for white, a negative score is good for black
+Whether the search can score a position as a draw without looking at its moves: it already occurred in the game or in the line
+being searched, so the side that repeated it can repeat it again, or the fifty-move rule is due and the side to move isn't mated.
+Mate is only looked for once the clock has run out and the side to move is in check, and only as far as the first legal move
+'''
+def isSearchDraw(gs):
+    if gs.repetitionCount() > 1:
+        return True
+    if gs.halfmoveClock < ChessEngine.FIFTY_MOVE_PLIES:
+        return False
+    return not gs.inCheck() or next(gs.getStagedMoves(), None) is not None
+
+'''
+Whether a score is a forced mate, for either side
+'''
+def isMateScore(score):
+    return abs(score) > MATE_BOUND
+
+'''
+Mate scores count plies from the root, the transposition table keeps them as plies from the stored position instead,
+so an entry reached at another ply or in a later search gives the right distance. Other scores are stored as they are
+'''
+def scoreToTable(score, ply):
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+'''
+Exact score of the position from the tablebases, for the side to move, or None if no tablebase covers it.
+Wins and losses are mate scores counted from the root like the search's own mates
+'''
+def probeTablebase(gs, ply):
+    global searchTablebaseHits
+    if not USE_TABLEBASES or gs.pieceCount > ChessTablebase.MAX_PIECES:
+        return None
+    result = ChessTablebase.probe(gs)
+    if result is None:
+        return None
+    searchTablebaseHits += 1
+    outcome, plies = result
+    if outcome == ChessTablebase.DRAW:
+        return STALEMATE
+    score = CHECKMATE - ply - plies #mated plies after this node, the same score the search gives a mate it finds there
+    return score if outcome == ChessTablebase.WIN else -score
+
+'''
+Search only captures and promotions at the leaves, so the board isn't scored in the middle of an exchange.
+The side to move can always "stand pat" and keep the static score instead of capturing, unless it is in check
+'''
+def quiescenceSearch(gs, alpha, beta, turnMultiplier, ply):
+    global searchQuiescenceNodes, searchMoveGenTime
+    checkSearchBudget()
+    searchQuiescenceNodes += 1
+    tablebaseScore = probeTablebase(gs, ply)
+    if tablebaseScore is not None:
+        return tablebaseScore
+    inCheck = gs.inCheck()
+    if inCheck:
+        standPat = -CHECKMATE #no standing pat in check, every evasion has to be searched
+    else:
+        standPat = turnMultiplier * (timeScoreBoard(gs) if PROFILE_SEARCH else scoreBoard(gs))
+        if standPat >= beta:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+    if PROFILE_SEARCH:
+        start = time.perf_counter()
+    moves = gs.getCaptureMoves() #all evasions when in check
+    orderMoves(moves, ply, -1)
+    if PROFILE_SEARCH:
+        searchMoveGenTime += time.perf_counter() - start
+    if inCheck and len(moves) == 0:
+        return -(CHECKMATE - ply)
+    bestScore = standPat
+    for move in moves:
+        if DELTA_PRUNING and not inCheck:
+            gain = ChessEval.MATERIAL_EG[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0
+            if move.isPawnPromotion:
+                gain += ChessEval.MATERIAL_EG["Q"] - ChessEval.MATERIAL_EG["p"]
+            if standPat + gain + DELTA_MARGIN <= alpha: #even winning the piece for free won't be enough
+                continue
+        gs.makeMove(move)
+        score = -quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, ply+1)
+        gs.undoMove()
+        if score > bestScore:
+            bestScore = score
+        if score > alpha:
+            alpha = score
+        if alpha >= beta:
+            break
+    return bestScore
+
+'''
+Score the board based on the game state, a positive score is good for white, a negative score is good for black.
+Material and piece-square tables in centipawns, kept up to date by the GameState as moves are made and undone
 '''
 def scoreBoard(gs):
     if gs.checkMate:
@@ -146,12 +737,11 @@ def scoreBoard(gs):
             return CHECKMATE #if it is black turn and there is a checkmate, then return the checkmate score, white wins
     elif gs.staleMate:
         return STALEMATE
-    score = scoreMaterial(gs.board)
-    return score
+    return gs.getEvaluation()
     
 
 '''
-Score the board based on material
+Score the board based on material only, in pawns. Walks all 64 squares, the search uses scoreBoard instead
 '''
 def scoreMaterial(board):
     score = 0 
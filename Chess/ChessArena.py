@@ -0,0 +1,251 @@
+#Headless engine-vs-engine arena. Plays games between two ChessAI configurations in parallel worker processes,
+#writes every finished game to a PGN file as soon as it is done and reports win/draw/loss with an Elo estimate.
+#
+#   python Chess/ChessArena.py --games 40                                     default settings against themselves
+#   python Chess/ChessArena.py --engine-a "DEPTH=4" --engine-b "DEPTH=3" --time 0.5
+#   python Chess/ChessArena.py --engine-a "DELTA_PRUNING=False" --nodes 20000 --workers 8 --pgn delta.pgn
+#
+#An engine configuration is a comma separated list of ChessAI settings, e.g. "DEPTH=4,TIME_LIMIT=0.5,DELTA_MARGIN=150".
+#Every game starts from one of the openings, each opening is played twice so both engines get both colors.
+import argparse
+import ast
+import datetime
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import ChessEngine
+import ChessAI
+
+#(name, moves in coordinate notation or a FEN)
+OPENINGS = [
+    ("Italian Game", "e2e4 e7e5 g1f3 b8c6 f1c4"),
+    ("Ruy Lopez", "e2e4 e7e5 g1f3 b8c6 f1b5"),
+    ("Sicilian Defence", "e2e4 c7c5 g1f3 d7d6"),
+    ("French Defence", "e2e4 e7e6 d2d4 d7d5"),
+    ("Caro-Kann Defence", "e2e4 c7c6 d2d4 d7d5"),
+    ("Queen's Gambit Declined", "d2d4 d7d5 c2c4 e7e6"),
+    ("King's Indian Defence", "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7"),
+    ("English Opening", "c2c4 e7e5 b1c3 g8f6"),
+]
+MAX_MOVES = 150 #full moves before the game is adjudicated a draw
+REPETITIONS = 3 #a position seen this many times is a draw
+PGN_FILE = "arena.pgn"
+
+'''
+Parse an engine configuration like "DEPTH=4,TIME_LIMIT=0.5" into a dict of ChessAI settings
+'''
+def parseConfig(text):
+    settings = {}
+    for item in text.split(","):
+        if item.strip() == "":
+            continue
+        if "=" not in item:
+            raise ValueError("engine setting '" + item + "' is not NAME=VALUE")
+        name, value = (part.strip() for part in item.split("=", 1))
+        if not hasattr(ChessAI, name):
+            raise ValueError("ChessAI has no setting " + name)
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            raise ValueError("bad value for " + name + ": " + value)
+    return settings
+
+'''
+Read openings from a file, one per line as moves in coordinate notation or a FEN. Blank lines and lines starting with # are skipped
+'''
+def loadOpenings(path):
+    openings = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                openings.append((line, line))
+    return openings
+
+'''
+Set the ChessAI settings for one engine. Settings the other engine changed go back to their defaults first
+'''
+def applyConfig(settings, defaults):
+    for name, value in defaults.items():
+        setattr(ChessAI, name, value)
+    for name, value in settings.items():
+        setattr(ChessAI, name, value)
+
+'''
+Play one game in a worker process. white and black are (name, settings). Returns a dict with the result, the PGN and the timings
+'''
+def playGame(number, opening, white, black, maxMoves, repetitions, seed):
+    random.seed(seed) #findBestMove shuffles the root moves
+    defaults = {name: getattr(ChessAI, name) for name in set(white[1]) | set(black[1])}
+    ChessAI.SEARCH_WORKERS = 1 #the games already run in parallel
+    tables = {True: ChessAI.TranspositionTable(), False: ChessAI.TranspositionTable()} #one per engine, so they don't share what they learned
+    gs = ChessEngine.newGameState()
+    openingName, openingText = opening
+    fen = None
+    if "/" in openingText:
+        fen = openingText
+        gs.loadFEN(fen)
+    startWhiteToMove = gs.whiteToMove
+    firstMove = gs.fullmoveNumber
+    sanMoves = []
+    seconds = {True: 0.0, False: 0.0}
+    validMoves = gs.getValidMoves()
+    openingMoves = [] if fen is not None else openingText.split()
+    result = termination = None
+    while result is None:
+        if gs.checkMate:
+            result, termination = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            break
+        if gs.staleMate:
+            result, termination = "1/2-1/2", "stalemate"
+            break
+        if len(sanMoves) >= maxMoves * 2:
+            result, termination = "1/2-1/2", "move limit"
+            break
+        if len(sanMoves) < len(openingMoves):
+            move = next((m for m in validMoves if m.getChessNotation() == openingMoves[len(sanMoves)]), None)
+            if move is None:
+                raise ValueError("illegal opening move " + openingMoves[len(sanMoves)] + " in " + openingName)
+        else:
+            side = gs.whiteToMove
+            name, settings = white if side else black
+            applyConfig(settings, defaults)
+            ChessAI.transpositionTable = tables[side]
+            start = time.perf_counter()
+            move = ChessAI.findBestMove(gs, list(validMoves))
+            seconds[side] += time.perf_counter() - start
+        san = move.getSAN(validMoves)
+        gs.makeMove(move)
+        validMoves = gs.getValidMoves()
+        if gs.inCheck():
+            san += "#" if len(validMoves) == 0 else "+"
+        sanMoves.append(san)
+        if len(validMoves) > 0: #a mate on the move that repeats a position or reaches the fifty-move limit still counts
+            if gs.repetitionCount() >= repetitions:
+                result, termination = "1/2-1/2", "repetition"
+            elif gs.halfmoveClock >= ChessEngine.FIFTY_MOVE_PLIES:
+                result, termination = "1/2-1/2", "fifty-move rule"
+    return {"number": number, "white": white[0], "black": black[0], "result": result, "termination": termination,
+            "plies": len(sanMoves), "whiteSeconds": seconds[True], "blackSeconds": seconds[False],
+            "pgn": formatPGN(number, openingName, fen, white[0], black[0], result, termination, seconds, sanMoves, startWhiteToMove, firstMove)}
+
+'''
+Write a game as PGN, with the movetext wrapped at 80 characters
+'''
+def formatPGN(number, openingName, fen, whiteName, blackName, result, termination, seconds, sanMoves, whiteToMove, moveNumber):
+    tags = [("Event", "ChessArena"), ("Site", "?"), ("Date", datetime.date.today().strftime("%Y.%m.%d")), ("Round", str(number)),
+            ("White", whiteName), ("Black", blackName), ("Result", result)]
+    if fen is not None:
+        tags += [("SetUp", "1"), ("FEN", fen)]
+    else:
+        tags.append(("Opening", openingName))
+    tags += [("Termination", termination), ("WhiteSeconds", "%.2f" % seconds[True]), ("BlackSeconds", "%.2f" % seconds[False])]
+    tokens = []
+    for san in sanMoves:
+        if whiteToMove:
+            tokens.append(str(moveNumber) + ".")
+        elif not tokens:
+            tokens.append(str(moveNumber) + "...") #the game starts with black to move
+        tokens.append(san)
+        if not whiteToMove:
+            moveNumber += 1
+        whiteToMove = not whiteToMove
+    tokens.append(result)
+    lines = []
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join('[%s "%s"]' % tag for tag in tags) + "\n\n" + "\n".join(lines) + "\n\n"
+
+'''
+Elo difference for a score fraction. Infinite when one side won or lost every game
+'''
+def eloFromScore(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+'''
+Elo difference of the first engine with a 95% confidence interval, from its wins, draws and losses. Returns (elo, low, high).
+low and high are None when one side scored every point or none, there is no interval around an infinite Elo then
+'''
+def eloDifference(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return eloFromScore(score), None, None
+    #per game score around the mean, with one extra win and loss counted so a match of nothing but draws doesn't get a zero margin
+    variance = (wins * (1 - score)**2 + draws * (0.5 - score)**2 + losses * score**2 + (1 - score)**2 + score**2) / (games + 2)
+    margin = 1.96 * math.sqrt(variance / games)
+    return eloFromScore(score), eloFromScore(score - margin), eloFromScore(score + margin)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play ChessAI configurations against each other without a window.")
+    parser.add_argument("--games", type=int, default=len(OPENINGS) * 2, help="number of games, every opening is played with both colors")
+    parser.add_argument("--engine-a", default="", help="ChessAI settings for engine A, e.g. \"DEPTH=4,TIME_LIMIT=0.5\"")
+    parser.add_argument("--engine-b", default="", help="ChessAI settings for engine B")
+    parser.add_argument("--name-a", default="A")
+    parser.add_argument("--name-b", default="B")
+    parser.add_argument("--time", type=float, help="seconds per move for both engines, unless their settings give TIME_LIMIT")
+    parser.add_argument("--nodes", type=int, help="nodes per move for both engines, unless their settings give NODE_LIMIT")
+    parser.add_argument("--openings", help="file with one opening per line, moves in coordinate notation or a FEN")
+    parser.add_argument("--max-moves", type=int, default=MAX_MOVES, help="full moves before a game is adjudicated a draw")
+    parser.add_argument("--repetitions", type=int, default=REPETITIONS, help="a position seen this many times is a draw")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="games played at the same time")
+    parser.add_argument("--pgn", default=PGN_FILE, help="file the games are written to as they finish")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    try:
+        engines = [(args.name_a, parseConfig(args.engine_a)), (args.name_b, parseConfig(args.engine_b))]
+    except ValueError as e:
+        parser.error(str(e))
+    for name, settings in engines:
+        if args.time is not None:
+            settings.setdefault("TIME_LIMIT", args.time)
+        if args.nodes is not None:
+            settings.setdefault("NODE_LIMIT", args.nodes)
+    openings = loadOpenings(args.openings) if args.openings else OPENINGS
+
+    wins = draws = losses = 0
+    start = time.perf_counter()
+    with open(args.pgn, "w") as pgn, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = []
+        for number in range(1, args.games + 1):
+            opening = openings[(number - 1) // 2 % len(openings)]
+            white, black = engines if number % 2 == 1 else engines[::-1] #A has white in the odd games
+            futures.append(pool.submit(playGame, number, opening, white, black, args.max_moves, args.repetitions, args.seed * 100003 + number))
+        for future in as_completed(futures):
+            game = future.result()
+            pgn.write(game["pgn"])
+            pgn.flush()
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == (game["white"] == args.name_a):
+                wins += 1
+            else:
+                losses += 1
+            print("game %3d  %s - %s  %-7s  %-10s  %3d plies  %6.1fs / %6.1fs   +%d =%d -%d" % (game["number"], game["white"], game["black"],
+                  game["result"], game["termination"], game["plies"], game["whiteSeconds"], game["blackSeconds"], wins, draws, losses))
+            sys.stdout.flush()
+    print("%s vs %s: +%d =%d -%d in %.1fs" % (args.name_a, args.name_b, wins, draws, losses, time.perf_counter() - start))
+    if wins + draws + losses > 0:
+        elo, low, high = eloDifference(wins, draws, losses)
+        if low is None:
+            print("Elo difference: %+.0f (95%% interval undefined, one side scored every point)" % elo)
+        else:
+            print("Elo difference: %+.0f (95%% interval %+.0f to %+.0f)" % (elo, low, high))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
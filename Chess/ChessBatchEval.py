@@ -0,0 +1,234 @@
+#Batch evaluation. Positions are encoded as 12x64 uint8 piece planes, one plane per piece in ChessBitboard.PIECES order with square
+#index row*8 + col, and a whole batch is scored with a few NumPy array operations: the same material and piece-square score as
+#GameState.getEvaluation, plus an optional mobility term. Made for scoring large sets of positions (training data, annotating
+#games); a single position is scored faster by the running evaluation the GameState keeps. NumPy is optional, without it the
+#same scores are worked out one position at a time in plain Python.
+#
+#   python Chess/ChessBatchEval.py positions.epd              score every FEN or EPD line, in centipawns from white's point of view
+#   python Chess/ChessBatchEval.py games.fen --mobility --out scores.txt
+import itertools
+import sys
+import time
+import ChessBitboard
+import ChessEngine
+import ChessEval
+try:
+    import numpy as np
+except ImportError: #NumPy is optional, see the top of the file
+    np = None
+
+PLANES = ChessBitboard.PIECES
+PLANE_INDEX = {piece: i for i, piece in enumerate(PLANES)}
+FEN_PLANES = {(piece[1].upper() if piece[0] == 'w' else piece[1].lower()): i for i, piece in enumerate(PLANES)} #FEN letter -> plane
+MOBILITY_WEIGHT = 3 #centipawns per square a knight, bishop, rook, queen or king can move to, white's count minus black's
+BATCH_SIZE = 10000 #positions encoded at a time by the command line, the planes of a batch take BATCH_SIZE * 768 bytes
+
+#weight of a piece on every plane square, laid out like the flattened planes
+MG_WEIGHTS = [ChessEval.SCORE_MG[piece][sq // 8][sq % 8] for piece in PLANES for sq in range(64)]
+EG_WEIGHTS = [ChessEval.SCORE_EG[piece][sq // 8][sq % 8] for piece in PLANES for sq in range(64)]
+PHASE_VALUES = [ChessEval.PHASE_WEIGHTS[piece[1]] for piece in PLANES for sq in range(64)]
+
+'''
+Indices into the flattened planes (plane * 64 + square) of the pieces on an 8x8 board like GameState.board
+'''
+def boardIndices(board):
+    return [PLANE_INDEX[piece] * 64 + r * 8 + c for r in range(8) for c, piece in enumerate(board[r]) if piece != "--"]
+
+'''
+Indices like boardIndices, read straight from the piece placement of a FEN or EPD line without setting up a GameState.
+Raises ValueError for a placement that isn't 8 rows of 8 squares
+'''
+def fenIndices(fen):
+    rows = fen.split(None, 1)[0].split('/') if fen.strip() else []
+    if len(rows) != 8:
+        raise ValueError("FEN needs 8 rows: " + fen)
+    indices = []
+    for r, row in enumerate(rows):
+        c = 0
+        for char in row:
+            if char.isdigit():
+                c += int(char) #a digit counts empty squares
+            elif char in FEN_PLANES:
+                indices.append(FEN_PLANES[char] * 64 + r * 8 + c)
+                c += 1
+            else:
+                raise ValueError("unknown piece '" + char + "' in FEN: " + fen)
+        if c != 8:
+            raise ValueError("FEN row '" + row + "' is not 8 squares long")
+    return indices
+
+'''
+Steps of a set of pieces by (row, col) offsets as (left shift?, shift amount, mask). The mask clears the squares a shift
+wraps round to from the other side of the board, and the bits shifted past h1
+'''
+def buildSteps(offsets, scalar):
+    fileMasks = {-2: ChessBitboard.FILE_H | ChessBitboard.FILE_H >> 1, -1: ChessBitboard.FILE_H, 0: 0,
+                 1: ChessBitboard.FILE_A, 2: ChessBitboard.FILE_A | ChessBitboard.FILE_A << 1} #files a piece can't land on going that way
+    return [(dr * 8 + dc > 0, scalar(abs(dr * 8 + dc)), scalar(ChessBitboard.FULL ^ fileMasks[dc])) for dr, dc in offsets]
+
+'''
+The bit operations the mobility count needs, for one kind of bitboard: plain Python ints, or NumPy uint64 arrays holding the
+bitboards of a whole batch. The same mobility code runs on both, so the two give the same scores
+'''
+class BitOps():
+    def __init__(self, scalar, popcount):
+        self.full = scalar(ChessBitboard.FULL)
+        self.popcount = popcount
+        self.knightSteps = buildSteps(ChessEngine.KNIGHT_OFFSETS, scalar)
+        self.kingSteps = buildSteps(ChessEngine.DIRECTIONS, scalar)
+        self.rookSteps = self.kingSteps[:4] #DIRECTIONS lists the orthogonal directions first
+        self.bishopSteps = self.kingSteps[4:]
+
+def shift(bb, step):
+    left, amount, mask = step
+    return ((bb << amount) if left else (bb >> amount)) & mask
+
+'''
+Squares attacked by a set of sliding pieces in one direction, up to and including the first piece in the way
+'''
+def slideAttacks(sliders, step, empty):
+    flood = ray = sliders
+    for i in range(6): #a ray crosses at most 6 empty squares before it reaches the edge or a blocker
+        ray = shift(ray, step) & empty
+        flood = flood | ray #not |=, that would write into the caller's NumPy bitboards
+    return shift(flood, step)
+
+'''
+Pseudo-legal moves of the knights, bishops, rooks, queens and king of one color, pawns and castling left out.
+Pieces moving the same way stop at each other, so counting whole sets at once gives the sum over the single pieces
+'''
+def sideMobility(bitboards, color, ops):
+    own = bitboards[PLANE_INDEX[color + 'p']]
+    for pieceType in "RNBQK":
+        own = own | bitboards[PLANE_INDEX[color + pieceType]]
+    occupied = own
+    for piece in PLANES:
+        if piece[0] != color:
+            occupied = occupied | bitboards[PLANE_INDEX[piece]]
+    empty = occupied ^ ops.full
+    targets = own ^ ops.full
+    count = 0
+    for pieceType, steps in (('N', ops.knightSteps), ('K', ops.kingSteps)):
+        for step in steps:
+            count = count + ops.popcount(shift(bitboards[PLANE_INDEX[color + pieceType]], step) & targets)
+    queens = bitboards[PLANE_INDEX[color + 'Q']]
+    for pieceType, steps in (('R', ops.rookSteps), ('B', ops.bishopSteps)):
+        sliders = bitboards[PLANE_INDEX[color + pieceType]] | queens
+        for step in steps:
+            count = count + ops.popcount(slideAttacks(sliders, step, empty) & targets)
+    return count
+
+'''
+White's mobility minus black's, for a list of the 12 bitboards in PLANES order
+'''
+def mobilityDifference(bitboards, ops):
+    return sideMobility(bitboards, 'w', ops) - sideMobility(bitboards, 'b', ops)
+
+INT_OPS = BitOps(int, lambda bb: bin(bb).count("1"))
+
+'''
+Score of one position from its plane indices, without NumPy. The same numbers as scorePlanes
+'''
+def scoreIndices(indices, mobility=False):
+    mgScore = egScore = phase = 0
+    for i in indices:
+        mgScore += MG_WEIGHTS[i]
+        egScore += EG_WEIGHTS[i]
+        phase += PHASE_VALUES[i]
+    score = ChessEval.taperedScore(mgScore, egScore, phase)
+    if mobility:
+        bitboards = [0] * len(PLANES)
+        for i in indices:
+            bitboards[i >> 6] |= 1 << (i & 63)
+        score += MOBILITY_WEIGHT * mobilityDifference(bitboards, INT_OPS)
+    return score
+
+if np is not None:
+    #(768, 3) middlegame, endgame and phase weights. A float product goes through BLAS, several times faster than an integer one,
+    #and every partial sum is a small integer that float32 holds exactly
+    WEIGHT_MATRIX = np.array([MG_WEIGHTS, EG_WEIGHTS, PHASE_VALUES], np.float32).T.copy()
+    POPCOUNT_BYTES = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+    NUMPY_OPS = BitOps(np.uint64, lambda bb: POPCOUNT_BYTES[np.ascontiguousarray(bb).view(np.uint8)].reshape(len(bb), 8).sum(axis=1, dtype=np.int64))
+
+'''
+Pack lists of plane indices into an (n, 12, 64) uint8 array of piece planes, 1 where a piece stands. Needs NumPy
+'''
+def encodePlanes(indexLists):
+    planes = np.zeros((len(indexLists), len(PLANES) * 64), np.uint8)
+    positions = np.repeat(np.arange(len(indexLists)), [len(indices) for indices in indexLists])
+    planes[positions, np.fromiter(itertools.chain.from_iterable(indexLists), np.intp)] = 1
+    return planes.reshape(len(indexLists), len(PLANES), 64)
+
+'''
+Scores of an (n, 12, 64) array of piece planes as an int64 array, in centipawns with white positive, tapered between
+middlegame and endgame like ChessEval.taperedScore. With mobility the MOBILITY_WEIGHT term is added. Needs NumPy
+'''
+def scorePlanes(planes, mobility=False):
+    if len(planes) == 0: #reshape can't work out the row length of an empty batch
+        return np.zeros(0, np.int64)
+    terms = np.rint(planes.reshape(len(planes), -1).astype(np.float32) @ WEIGHT_MATRIX).astype(np.int64)
+    mgScores, egScores = terms[:, 0], terms[:, 1]
+    phases = np.minimum(terms[:, 2], ChessEval.MAX_PHASE) #promotions can push the phase past the starting material
+    scores = (mgScores * phases + egScores * (ChessEval.MAX_PHASE - phases)) // ChessEval.MAX_PHASE
+    if mobility:
+        bitboards = np.packbits(planes, axis=2, bitorder="little").view("<u8")[:, :, 0] #(n, 12), bit i of a plane is square i
+        scores += MOBILITY_WEIGHT * mobilityDifference([bitboards[:, i] for i in range(len(PLANES))], NUMPY_OPS)
+    return scores
+
+'''
+Scores of a list of plane index lists as a list of ints, in one NumPy batch when NumPy is installed
+'''
+def scoreIndexLists(indexLists, mobility=False):
+    if np is None:
+        return [scoreIndices(indices, mobility) for indices in indexLists]
+    return scorePlanes(encodePlanes(indexLists), mobility).tolist()
+
+'''
+Scores of a list of 8x8 boards (GameState.board), in centipawns with white positive. Without mobility every score is
+what GameState.getEvaluation gives for that position
+'''
+def scoreBoards(boards, mobility=False):
+    return scoreIndexLists([boardIndices(board) for board in boards], mobility)
+
+'''
+Scores of a list of FEN or EPD strings, only the piece placement is read. Raises ValueError for a bad placement
+'''
+def scoreFENs(fens, mobility=False):
+    return scoreIndexLists([fenIndices(fen) for fen in fens], mobility)
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Score every position of FEN/EPD files in batches, white's point of view in centipawns.")
+    parser.add_argument("files", nargs="+", help="files with one FEN or EPD position per line")
+    parser.add_argument("--mobility", action="store_true", help="add the mobility term to the material and piece-square score")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="positions scored in one NumPy call")
+    parser.add_argument("--out", help="file to write the scores to, one 'score FEN' line per position (default: standard output)")
+    args = parser.parse_args(argv)
+
+    lines = []
+    for path in args.files:
+        try:
+            with open(path) as f:
+                lines += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        except OSError as e:
+            parser.error(str(e))
+    out = open(args.out, "w") if args.out else sys.stdout
+    start = time.perf_counter()
+    try:
+        for first in range(0, len(lines), args.batch):
+            batch = lines[first:first + args.batch]
+            try:
+                scores = scoreFENs(batch, args.mobility)
+            except ValueError as e:
+                parser.error(str(e))
+            out.writelines("%d %s\n" % (score, line) for score, line in zip(scores, batch))
+    finally:
+        if args.out:
+            out.close()
+    seconds = time.perf_counter() - start
+    print("%d positions in %.2fs, %.0f positions/sec with %s" % (len(lines), seconds, len(lines) / max(seconds, 1e-9),
+          "NumPy" if np is not None else "plain Python (install NumPy for batch scoring)"), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,671 @@
+#This is the bitboard backend for the GameState. The position is kept in twelve 64-bit piece bitboards and the occupancy masks, so move generation
+#can work on whole sets of squares at once. Moves are made and taken back on the bitboards alone, the 8x8 board is only built when something reads it.
+import ChessEngine
+import ChessEval
+
+#square index is row*8 + col, so bit 0 is a8 (top left of the board list) and bit 63 is h1
+PIECES = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
+FULL = (1 << 64) - 1 #mask used to cut off bits shifted past h1
+FILE_A = sum(1 << (r*8) for r in range(8))
+FILE_H = sum(1 << (r*8 + 7) for r in range(8))
+PROMOTION_ROWS = 0xFF | (0xFF << 56) #rows 0 and 7, a pawn can only get there by promoting
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)] #(row, col) for every square index
+
+'''
+Build a table of the squares a leaping piece (knight, king, pawn capture) attacks from every square
+'''
+def buildLeaperTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = SQUARES[sq]
+        mask = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                mask |= 1 << ((r + dr)*8 + c + dc)
+        table.append(mask)
+    return table
+
+'''
+Build the ray in direction (dr, dc) from every square, not including the square itself
+'''
+def buildRayTable(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = SQUARES[sq]
+        mask = 0
+        r, c = r + dr, c + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            mask |= 1 << (r*8 + c)
+            r, c = r + dr, c + dc
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = buildLeaperTable(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = buildLeaperTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+PAWN_ATTACKS = {'w': buildLeaperTable(((-1, -1), (-1, 1))), 'b': buildLeaperTable(((1, -1), (1, 1)))} #squares a pawn of that color attacks
+
+#each direction is (ray table, True if the square index grows along the ray), the nearest blocker is the lowest bit on growing rays and the highest bit otherwise
+ROOK_RAYS = [(buildRayTable(dr, dc), dr*8 + dc > 0) for dr, dc in ((-1, 0), (0, -1), (1, 0), (0, 1))]
+BISHOP_RAYS = [(buildRayTable(dr, dc), dr*8 + dc > 0) for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1))]
+
+'''
+Index of the lowest set bit
+'''
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+'''
+Squares attacked along the given rays from sq, stopping at (and including) the first blocker on each ray
+'''
+def slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for table, growing in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = lsb(blockers) if growing else blockers.bit_length() - 1
+            ray ^= table[blocker] #drop everything behind the blocker
+        attacks |= ray
+    return attacks
+
+'''
+Build the attacks along a line through every square (two opposite rays) for every way the line can be occupied, so sliding attacks
+become a lookup instead of a walk along the rays. Returns the mask of the squares that matter on each line and a dict per square from
+the occupied squares in that mask to the attacks. The last square of a ray is left out of the mask, it is attacked whether it is empty or not
+'''
+def buildLineTable(rays):
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = 0
+        for table, growing in rays:
+            ray = table[sq]
+            if ray:
+                mask |= ray ^ (1 << (ray.bit_length() - 1) if growing else ray & -ray)
+        attacks = {}
+        occupied = 0
+        while True: #step through every subset of the mask
+            attacks[occupied] = slidingAttacks(sq, occupied, rays)
+            occupied = (occupied - mask) & mask
+            if occupied == 0:
+                break
+        masks.append(mask)
+        tables.append(attacks)
+    return masks, tables
+
+RANK_MASKS, RANK_ATTACKS = buildLineTable([ROOK_RAYS[1], ROOK_RAYS[3]])
+FILE_MASKS, FILE_ATTACKS = buildLineTable([ROOK_RAYS[0], ROOK_RAYS[2]])
+DIAGONAL_MASKS, DIAGONAL_ATTACKS = buildLineTable([BISHOP_RAYS[0], BISHOP_RAYS[3]]) #a8-h1 direction
+ANTIDIAGONAL_MASKS, ANTIDIAGONAL_ATTACKS = buildLineTable([BISHOP_RAYS[1], BISHOP_RAYS[2]]) #h8-a1 direction
+
+'''
+Squares a rook on sq attacks, up to and including the first blocker in each direction
+'''
+def rookAttacks(sq, occupied):
+    return RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]] | FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]]
+
+'''
+Squares a bishop on sq attacks, up to and including the first blocker in each direction
+'''
+def bishopAttacks(sq, occupied):
+    return DIAGONAL_ATTACKS[sq][occupied & DIAGONAL_MASKS[sq]] | ANTIDIAGONAL_ATTACKS[sq][occupied & ANTIDIAGONAL_MASKS[sq]]
+
+
+#the per-square tables of ChessEngine and ChessEval flattened to square indices, so make and undo don't go through rows and columns
+ZOBRIST_PIECES = {piece: [table[sq // 8][sq % 8] for sq in range(64)] for piece, table in ChessEngine.ZOBRIST_PIECES.items()}
+SCORE_MG = {piece: [table[sq // 8][sq % 8] for sq in range(64)] for piece, table in ChessEval.SCORE_MG.items()}
+SCORE_EG = {piece: [table[sq // 8][sq % 8] for sq in range(64)] for piece, table in ChessEval.SCORE_EG.items()}
+PHASE_WEIGHTS = {piece: ChessEval.PHASE_WEIGHTS[piece[1]] for piece in ChessEngine.PIECE_NAMES}
+CASTLE_MASKS = [ChessEngine.CASTLE_MASKS[sq // 8][sq % 8] for sq in range(64)]
+
+class Move(ChessEngine.Move):
+    __slots__ = ()
+
+    '''
+    The same Move as ChessEngine.Move, made from square indices and the squares list of the bitboard GameState instead of an 8x8 board
+    '''
+    def __init__(self, fromSq, toSq, squares, isEnpassantMove=False, isCastleMove=False):
+        self.startRow, self.startCol = SQUARES[fromSq]
+        self.endRow = endRow = toSq >> 3
+        self.endCol = toSq & 7
+        self.pieceMoved = pieceMoved = squares[fromSq]
+        self.isPawnPromotion = (pieceMoved == 'wp' and endRow == 0) or (pieceMoved == 'bp' and endRow == 7)
+        self.isEnpassantMove = isEnpassantMove
+        if isEnpassantMove:
+            self.pieceCaptured = 'wp' if pieceMoved == 'bp' else 'bp'
+        else:
+            self.pieceCaptured = squares[toSq]
+        self.isCastleMove = isCastleMove
+        self.moveID = fromSq | toSq << 6
+
+
+class GameState(ChessEngine.GameState):
+    backend = "bitboard"
+
+    '''
+    The position lives in the twelve piece bitboards, the occupancy masks and squares, a flat list of the piece on every square index
+    that tells a move what it captures. makeMove and undoMove only update those, the 8x8 board is derived from squares when it is read
+    '''
+    @property
+    def board(self):
+        if self.boardCache is None:
+            squares = self.squares
+            self.boardCache = [squares[sq:sq + 8] for sq in range(0, 64, 8)]
+        return self.boardCache
+
+    '''
+    Setting the board (GameState.__init__ and loadFEN do) sets up squares and the bitboards from it. Writing into the list the board
+    property returns doesn't change the position, it is a copy
+    '''
+    @board.setter
+    def board(self, board):
+        self.squares = [piece for row in board for piece in row]
+        self.boardCache = None
+        self.syncBitboards()
+
+    '''
+    Rebuild the piece bitboards and occupancy masks from squares
+    '''
+    def syncBitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        for sq, piece in enumerate(self.squares):
+            if piece != "--":
+                self.bitboards[piece] |= 1 << sq
+        self.colorOccupancy = {'w': 0, 'b': 0}
+        for piece in PIECES:
+            self.colorOccupancy[piece[0]] |= self.bitboards[piece]
+        self.occupied = self.colorOccupancy['w'] | self.colorOccupancy['b']
+
+    '''
+    Make a move on the bitboards and squares. Keeps the key, running evaluation, undo stack and counters like GameState.makeMove does
+    '''
+    def makeMove(self, move):
+        fromSq = move.startRow*8 + move.startCol
+        toSq = move.endRow*8 + move.endCol
+        moved = move.pieceMoved
+        captured = move.pieceCaptured
+        color = moved[0]
+        #save what undoMove can't work out from the move, packed like GameState.makeMove does
+        rights = self.castlingRights
+        ply = len(self.moveLog)
+        undoStack = self.undoStack
+        if ply == len(undoStack):
+            undoStack.extend([0] * len(undoStack))
+        enpassantFile = self.enpassantPossible[1] + 1 if self.enpassantPossible != () else 0
+        undoStack[ply] = (self.zobristKey << ChessEngine.UNDO_KEY_SHIFT | self.halfmoveClock << ChessEngine.UNDO_CLOCK_SHIFT
+                          | ChessEngine.PIECE_INDEX[captured] << ChessEngine.UNDO_CAPTURED_SHIFT | enpassantFile << ChessEngine.UNDO_EP_SHIFT | rights)
+        key = self.zobristKey ^ ChessEngine.ZOBRIST_BLACK_TO_MOVE ^ ChessEngine.ZOBRIST_CASTLING_KEYS[rights]
+        if enpassantFile:
+            key ^= ChessEngine.ZOBRIST_ENPASSANT[enpassantFile - 1]
+        landed = color + 'Q' if move.isPawnPromotion else moved
+        bitboards = self.bitboards
+        squares = self.squares
+        colorOccupancy = self.colorOccupancy
+        fromBit = 1 << fromSq
+        toBit = 1 << toSq
+        bitboards[moved] ^= fromBit
+        bitboards[landed] ^= toBit
+        ours = colorOccupancy[color] ^ (fromBit | toBit)
+        squares[fromSq] = "--"
+        squares[toSq] = landed
+        key ^= ZOBRIST_PIECES[moved][fromSq] ^ ZOBRIST_PIECES[landed][toSq]
+        mgScore = self.mgScore - SCORE_MG[moved][fromSq] + SCORE_MG[landed][toSq]
+        egScore = self.egScore - SCORE_EG[moved][fromSq] + SCORE_EG[landed][toSq]
+        self.phase += PHASE_WEIGHTS[landed] - PHASE_WEIGHTS[moved]
+        if captured != "--":
+            capturedSq = toSq
+            if move.isEnpassantMove: #the en passant victim sits beside the moving pawn
+                capturedSq = fromSq - move.startCol + move.endCol
+                squares[capturedSq] = "--"
+            capturedBit = 1 << capturedSq
+            bitboards[captured] ^= capturedBit
+            colorOccupancy[captured[0]] ^= capturedBit
+            key ^= ZOBRIST_PIECES[captured][capturedSq]
+            mgScore -= SCORE_MG[captured][capturedSq]
+            egScore -= SCORE_EG[captured][capturedSq]
+            self.phase -= PHASE_WEIGHTS[captured]
+            self.pieceCount -= 1
+            self.halfmoveClock = 0
+        elif moved[1] == 'p':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if moved[1] == 'K':
+            if color == 'w':
+                self.whiteKingLocation = SQUARES[toSq]
+            else:
+                self.blackKingLocation = SQUARES[toSq]
+            if move.isCastleMove:
+                rookFrom, rookTo = (toSq + 1, toSq - 1) if toSq > fromSq else (toSq - 2, toSq + 1)
+                rook = color + 'R'
+                rookBits = (1 << rookFrom) | (1 << rookTo)
+                bitboards[rook] ^= rookBits
+                ours ^= rookBits
+                squares[rookFrom] = "--"
+                squares[rookTo] = rook
+                key ^= ZOBRIST_PIECES[rook][rookFrom] ^ ZOBRIST_PIECES[rook][rookTo]
+                mgScore += SCORE_MG[rook][rookTo] - SCORE_MG[rook][rookFrom]
+                egScore += SCORE_EG[rook][rookTo] - SCORE_EG[rook][rookFrom]
+        colorOccupancy[color] = ours
+        self.occupied = ours | colorOccupancy['b' if color == 'w' else 'w']
+        self.mgScore = mgScore
+        self.egScore = egScore
+        self.whiteToMove = whiteToMove = not self.whiteToMove
+        if moved[1] == 'p' and (toSq - fromSq == 16 or fromSq - toSq == 16): #only on 2 square pawn advances
+            self.enpassantPossible = ChessEngine.ENPASSANT_SQUARES[whiteToMove][move.startCol]
+            key ^= ChessEngine.ZOBRIST_ENPASSANT[move.startCol]
+        else:
+            self.enpassantPossible = ()
+        rights &= CASTLE_MASKS[fromSq] & CASTLE_MASKS[toSq]
+        self.castlingRights = rights
+        key ^= ChessEngine.ZOBRIST_CASTLING_KEYS[rights]
+        self.zobristKey = key
+        counts = self.positionCounts
+        counts[key] = counts.get(key, 0) + 1
+        if whiteToMove: #black just moved
+            self.fullmoveNumber += 1
+        self.moveLog.append(move)
+        self.boardCache = None
+
+    '''
+    Undo the last move made, the reverse of makeMove
+    '''
+    def undoMove(self):
+        if len(self.moveLog) == 0:
+            return
+        move = self.moveLog.pop()
+        state = self.undoStack[len(self.moveLog)]
+        fromSq = move.startRow*8 + move.startCol
+        toSq = move.endRow*8 + move.endCol
+        moved = move.pieceMoved
+        captured = move.pieceCaptured
+        color = moved[0]
+        bitboards = self.bitboards
+        squares = self.squares
+        colorOccupancy = self.colorOccupancy
+        landed = squares[toSq]
+        fromBit = 1 << fromSq
+        toBit = 1 << toSq
+        bitboards[moved] ^= fromBit
+        bitboards[landed] ^= toBit
+        ours = colorOccupancy[color] ^ (fromBit | toBit)
+        squares[fromSq] = moved
+        squares[toSq] = "--"
+        mgScore = self.mgScore + SCORE_MG[moved][fromSq] - SCORE_MG[landed][toSq]
+        egScore = self.egScore + SCORE_EG[moved][fromSq] - SCORE_EG[landed][toSq]
+        self.phase += PHASE_WEIGHTS[moved] - PHASE_WEIGHTS[landed]
+        if captured != "--":
+            capturedSq = fromSq - move.startCol + move.endCol if move.isEnpassantMove else toSq
+            capturedBit = 1 << capturedSq
+            bitboards[captured] ^= capturedBit
+            colorOccupancy[captured[0]] ^= capturedBit
+            squares[capturedSq] = captured
+            mgScore += SCORE_MG[captured][capturedSq]
+            egScore += SCORE_EG[captured][capturedSq]
+            self.phase += PHASE_WEIGHTS[captured]
+            self.pieceCount += 1
+        if moved[1] == 'K':
+            if color == 'w':
+                self.whiteKingLocation = SQUARES[fromSq]
+            else:
+                self.blackKingLocation = SQUARES[fromSq]
+            if move.isCastleMove:
+                rookFrom, rookTo = (toSq + 1, toSq - 1) if toSq > fromSq else (toSq - 2, toSq + 1)
+                rook = color + 'R'
+                rookBits = (1 << rookFrom) | (1 << rookTo)
+                bitboards[rook] ^= rookBits
+                ours ^= rookBits
+                squares[rookTo] = "--"
+                squares[rookFrom] = rook
+                mgScore -= SCORE_MG[rook][rookTo] - SCORE_MG[rook][rookFrom]
+                egScore -= SCORE_EG[rook][rookTo] - SCORE_EG[rook][rookFrom]
+        colorOccupancy[color] = ours
+        self.occupied = ours | colorOccupancy['b' if color == 'w' else 'w']
+        self.mgScore = mgScore
+        self.egScore = egScore
+        self.whiteToMove = whiteToMove = not self.whiteToMove
+        #the en passant square, castling rights, halfmove clock and key from before the move come off the undo stack
+        enpassantFile = state >> ChessEngine.UNDO_EP_SHIFT & 15
+        self.enpassantPossible = ChessEngine.ENPASSANT_SQUARES[whiteToMove][enpassantFile - 1] if enpassantFile else ()
+        self.castlingRights = state & ChessEngine.CASTLE_ALL
+        counts = self.positionCounts
+        count = counts[self.zobristKey]
+        if count == 1:
+            del counts[self.zobristKey]
+        else:
+            counts[self.zobristKey] = count - 1
+        self.zobristKey = state >> ChessEngine.UNDO_KEY_SHIFT
+        self.halfmoveClock = state >> ChessEngine.UNDO_CLOCK_SHIFT & ChessEngine.UNDO_CLOCK_MASK
+        if not whiteToMove: #taking back a black move
+            self.fullmoveNumber -= 1
+        self.checkMate = False
+        self.staleMate = False
+        self.boardCache = None
+
+    '''
+    Bitboard of all pieces of the given color that attack sq, for the given occupancy
+    '''
+    def attackersTo(self, sq, color, occupied):
+        bitboards = self.bitboards
+        queens = bitboards[color + 'Q']
+        attackers = (KNIGHT_ATTACKS[sq] & bitboards[color + 'N']) | (KING_ATTACKS[sq] & bitboards[color + 'K'])
+        attackers |= PAWN_ATTACKS['b' if color == 'w' else 'w'][sq] & bitboards[color + 'p'] #a pawn attacks sq if sq attacks it back as an enemy pawn
+        rooks = bitboards[color + 'R'] | queens
+        if rooks:
+            attackers |= rookAttacks(sq, occupied) & rooks
+        bishops = bitboards[color + 'B'] | queens
+        if bishops:
+            attackers |= bishopAttacks(sq, occupied) & bishops
+        return attackers
+
+    '''
+    Determine if the enemy can attack the square r, c
+    '''
+    def squareUnderAttack(self, r, c):
+        return self.attackersTo(r*8 + c, 'b' if self.whiteToMove else 'w', self.occupied) != 0
+
+    '''
+    Determine if the current player is in check
+    '''
+    def inCheck(self):
+        color = 'w' if self.whiteToMove else 'b'
+        king = self.bitboards[color + 'K']
+        return king != 0 and self.attackersTo(lsb(king), 'b' if self.whiteToMove else 'w', self.occupied) != 0
+
+    '''
+    All moves without considering checks
+    '''
+    def getAllPossibleMoves(self):
+        moves = []
+        self.generateMoves(moves, FULL, {})
+        self.getBitboardEnpassantMoves(None, 'w' if self.whiteToMove else 'b', 'b' if self.whiteToMove else 'w', moves)
+        return moves
+
+    '''
+    All moves considering checks, without touching checkMate and staleMate. Checkers and pinned pieces are worked out once
+    from the king, so every move that comes out of the generator is already legal and nothing has to be made and taken back
+    '''
+    def getLegalMoves(self):
+        us = 'w' if self.whiteToMove else 'b'
+        them = 'b' if self.whiteToMove else 'w'
+        moves = []
+        king = self.bitboards[us + 'K']
+        if king == 0: #no king on the board, nothing can be pinned or checked
+            self.generateMoves(moves, FULL, {})
+            self.getBitboardEnpassantMoves(None, us, them, moves)
+            return moves
+        kingSq = lsb(king)
+        checkers, checkMask, pins = self.checkersAndPins(kingSq, us, them)
+        self.getBitboardKingMoves(kingSq, us, them, moves)
+        if checkers & (checkers - 1) == 0: #with two checkers only the king can move
+            self.generateMoves(moves, checkMask, pins, includeKing=False)
+            self.getBitboardEnpassantMoves(kingSq, us, them, moves)
+            if checkers == 0:
+                self.getBitboardCastleMoves(kingSq, us, them, moves)
+        return moves
+
+    '''
+    Legal captures and promotions only, for the quiescence search. When in check every evasion is returned instead
+    '''
+    def getCaptureMoves(self):
+        us = 'w' if self.whiteToMove else 'b'
+        them = 'b' if self.whiteToMove else 'w'
+        king = self.bitboards[us + 'K']
+        if king == 0:
+            return [move for move in self.getLegalMoves() if move.pieceCaptured != "--" or move.isPawnPromotion]
+        kingSq = lsb(king)
+        checkers, checkMask, pins = self.checkersAndPins(kingSq, us, them)
+        if checkers:
+            return self.getLegalMoves()
+        moves = []
+        enemies = self.colorOccupancy[them]
+        self.getBitboardKingMoves(kingSq, us, them, moves, enemies)
+        self.generateMoves(moves, enemies, pins, includeKing=False, pawnTargetMask=enemies | PROMOTION_ROWS)
+        self.getBitboardEnpassantMoves(kingSq, us, them, moves)
+        return moves
+
+    '''
+    Pseudo-legal moves that capture nothing and don't promote, for GameState.getStagedMoves
+    '''
+    def getQuietMoves(self):
+        empty = ~self.occupied & FULL
+        moves = []
+        self.generateMoves(moves, empty, {}, pawnTargetMask=empty & ~PROMOTION_ROWS)
+        return moves
+
+    '''
+    Check that a pseudo-legal move doesn't leave our own king attacked, using the occupancy after the move.
+    The captured piece is still in the enemy bitboards, so it is masked out of the attackers
+    '''
+    def isLegalMove(self, move):
+        us = 'w' if self.whiteToMove else 'b'
+        king = self.bitboards[us + 'K']
+        if king == 0:
+            return True
+        fromBit = 1 << (move.startRow*8 + move.startCol)
+        toBit = 1 << (move.endRow*8 + move.endCol)
+        capturedBit = 1 << (move.startRow*8 + move.endCol) if move.isEnpassantMove else toBit
+        kingSq = move.endRow*8 + move.endCol if move.pieceMoved[1] == 'K' else lsb(king)
+        occupied = (self.occupied ^ fromBit) & ~capturedBit | toBit
+        return self.attackersTo(kingSq, 'b' if us == 'w' else 'w', occupied) & ~capturedBit == 0
+
+    '''
+    Turn a moveID from the transposition table back into a Move if it is legal here, None otherwise. The target square
+    is checked against the attack tables of the piece, so no moves are generated. Only called when not in check
+    '''
+    def getHashMove(self, moveID):
+        us = 'w' if self.whiteToMove else 'b'
+        them = 'b' if self.whiteToMove else 'w'
+        fromSq = moveID & 63
+        toSq = moveID >> 6 & 63
+        fromBit = 1 << fromSq
+        toBit = 1 << toSq
+        ours = self.colorOccupancy[us]
+        if not ours & fromBit or ours & toBit:
+            return None
+        (r, c), end = SQUARES[fromSq], SQUARES[toSq]
+        pieceType = self.squares[fromSq][1]
+        occupied = self.occupied
+        if pieceType == 'p':
+            if self.enpassantPossible == end:
+                king = self.bitboards[us + 'K']
+                moves = []
+                self.getBitboardEnpassantMoves(lsb(king) if king else None, us, them, moves)
+                return next((move for move in moves if move.moveID == moveID), None)
+            push = -8 if us == 'w' else 8 #white pawns move towards row 0
+            if toSq - fromSq == push:
+                targets = toBit & ~occupied
+            elif toSq - fromSq == 2*push and r == (6 if us == 'w' else 1) and not occupied & (1 << (fromSq + push)):
+                targets = toBit & ~occupied
+            else:
+                targets = PAWN_ATTACKS[us][fromSq] & self.colorOccupancy[them]
+        elif pieceType == 'K' and abs(end[1] - c) == 2:
+            moves = []
+            self.getBitboardCastleMoves(fromSq, us, them, moves) #castling is legal as generated
+            return next((move for move in moves if move.moveID == moveID), None)
+        elif pieceType == 'N':
+            targets = KNIGHT_ATTACKS[fromSq]
+        elif pieceType == 'K':
+            targets = KING_ATTACKS[fromSq]
+        elif pieceType == 'B':
+            targets = bishopAttacks(fromSq, occupied)
+        elif pieceType == 'R':
+            targets = rookAttacks(fromSq, occupied)
+        else:
+            targets = rookAttacks(fromSq, occupied) | bishopAttacks(fromSq, occupied)
+        if not targets & toBit:
+            return None
+        move = Move(fromSq, toSq, self.squares)
+        return move if self.isLegalMove(move) else None
+
+    '''
+    Castling from the bitboards, for GameState.getStagedMoves. Nothing is added while in check
+    '''
+    def getCastleMoves(self, r, c, moves):
+        them = 'b' if self.whiteToMove else 'w'
+        if not self.attackersTo(r*8 + c, them, self.occupied):
+            self.getBitboardCastleMoves(r*8 + c, 'w' if self.whiteToMove else 'b', them, moves)
+
+    '''
+    Walk the rays out from the king to find the pieces giving check and our pieces pinned against the king.
+    Returns the checkers, the mask of squares that resolve a single check and a dict of pinned square -> allowed squares
+    '''
+    def checkersAndPins(self, kingSq, us, them):
+        bitboards = self.bitboards
+        ours = self.colorOccupancy[us]
+        occupied = self.occupied
+        checkers = (KNIGHT_ATTACKS[kingSq] & bitboards[them + 'N']) | (PAWN_ATTACKS[us][kingSq] & bitboards[them + 'p'])
+        checkMask = checkers
+        pins = {}
+        queens = bitboards[them + 'Q']
+        for rays, sliders in ((ROOK_RAYS, bitboards[them + 'R'] | queens), (BISHOP_RAYS, bitboards[them + 'B'] | queens)):
+            if sliders == 0:
+                continue
+            for table, growing in rays:
+                ray = table[kingSq]
+                if ray & sliders == 0:
+                    continue
+                blockers = ray & occupied
+                first = lsb(blockers) if growing else blockers.bit_length() - 1
+                firstBit = 1 << first
+                if firstBit & sliders: #nothing in between, it's a check
+                    checkers |= firstBit
+                    checkMask |= ray ^ table[first]
+                elif firstBit & ours: #our piece, see if an enemy slider is right behind it
+                    blockers ^= firstBit
+                    if blockers:
+                        second = lsb(blockers) if growing else blockers.bit_length() - 1
+                        if (1 << second) & sliders:
+                            pins[first] = ray ^ table[second]
+        if checkers == 0:
+            checkMask = FULL #not in check, every target square is fine
+        return checkers, checkMask, pins
+
+    '''
+    Generate the moves of every piece except the king's legal moves, limited to the squares in targetMask (pawnTargetMask for pawns if given).
+    Pieces in pins may only move along their pin ray. includeKing adds the king's moves without any safety check
+    '''
+    def generateMoves(self, moves, targetMask, pins, includeKing=True, pawnTargetMask=None):
+        us = 'w' if self.whiteToMove else 'b'
+        them = 'b' if self.whiteToMove else 'w'
+        bitboards = self.bitboards
+        occupied = self.occupied
+        available = ~self.colorOccupancy[us] & targetMask #empty or enemy squares we are allowed to land on
+        self.getBitboardPawnMoves(us, them, moves, targetMask if pawnTargetMask is None else pawnTargetMask, pins)
+        for piece in "NBRQK":
+            if piece == 'K' and not includeKing:
+                continue
+            pieces = bitboards[us + piece]
+            while pieces:
+                fromBit = pieces & -pieces
+                pieces ^= fromBit
+                fromSq = fromBit.bit_length() - 1
+                if piece == 'N':
+                    targets = KNIGHT_ATTACKS[fromSq]
+                elif piece == 'K':
+                    targets = KING_ATTACKS[fromSq]
+                elif piece == 'B':
+                    targets = bishopAttacks(fromSq, occupied)
+                elif piece == 'R':
+                    targets = rookAttacks(fromSq, occupied)
+                else:
+                    targets = rookAttacks(fromSq, occupied) | bishopAttacks(fromSq, occupied)
+                targets &= available
+                if fromSq in pins:
+                    targets &= pins[fromSq]
+                self.addMoves(fromSq, targets, moves)
+
+    '''
+    Add a Move from fromSq to every square in the targets bitboard
+    '''
+    def addMoves(self, fromSq, targets, moves):
+        squares = self.squares
+        while targets:
+            toBit = targets & -targets
+            targets ^= toBit
+            moves.append(Move(fromSq, toBit.bit_length() - 1, squares))
+
+    '''
+    Pawn pushes and captures for the whole pawn set at once. En passant is generated separately
+    '''
+    def getBitboardPawnMoves(self, us, them, moves, targetMask, pins):
+        pawns = self.bitboards[us + 'p']
+        if pawns == 0:
+            return
+        empty = ~self.occupied & FULL
+        enemies = self.colorOccupancy[them]
+        if us == 'w': #white pawns move towards row 0, so towards lower bits
+            singles = (pawns >> 8) & empty
+            doubles = ((singles & (0xFF << 40)) >> 8) & empty #pawns that just reached row 5 from row 6
+            captureLeft = ((pawns & ~FILE_A) >> 9) & enemies
+            captureRight = ((pawns & ~FILE_H) >> 7) & enemies
+            shifts = ((singles, 8), (doubles, 16), (captureLeft, 9), (captureRight, 7))
+        else:
+            singles = (pawns << 8) & empty
+            doubles = ((singles & (0xFF << 16)) << 8) & empty #pawns that just reached row 2 from row 1
+            captureLeft = ((pawns & ~FILE_A) << 7) & enemies
+            captureRight = ((pawns & ~FILE_H) << 9) & enemies
+            shifts = ((singles, -8), (doubles, -16), (captureLeft, -7), (captureRight, -9))
+        squares = self.squares
+        for targets, offset in shifts:
+            targets &= targetMask
+            while targets:
+                toBit = targets & -targets
+                targets ^= toBit
+                toSq = toBit.bit_length() - 1
+                fromSq = toSq + offset
+                if fromSq in pins and not toBit & pins[fromSq]:
+                    continue
+                moves.append(Move(fromSq, toSq, squares))
+
+    '''
+    En passant captures. Two pawns leave the same row, so instead of reasoning about pins we just check the king's safety on the resulting occupancy.
+    With kingSq None the safety check is skipped
+    '''
+    def getBitboardEnpassantMoves(self, kingSq, us, them, moves):
+        if self.enpassantPossible == ():
+            return
+        epRow, epCol = self.enpassantPossible
+        epSq = epRow*8 + epCol
+        capturers = PAWN_ATTACKS[them][epSq] & self.bitboards[us + 'p']
+        capturedSq = epSq + (8 if us == 'w' else -8)
+        capturedBit = 1 << capturedSq
+        if not self.bitboards[them + 'p'] & capturedBit:
+            return
+        while capturers:
+            fromBit = capturers & -capturers
+            capturers ^= fromBit
+            occupied = (self.occupied ^ fromBit ^ capturedBit) | (1 << epSq)
+            if kingSq is None or self.attackersTo(kingSq, them, occupied) & ~capturedBit == 0:
+                moves.append(Move(fromBit.bit_length() - 1, epSq, self.squares, isEnpassantMove=True))
+
+    '''
+    King steps onto squares that are not attacked once the king itself is out of the way (so it can't step back along a checking ray)
+    '''
+    def getBitboardKingMoves(self, kingSq, us, them, moves, targetMask=FULL):
+        targets = KING_ATTACKS[kingSq] & ~self.colorOccupancy[us] & targetMask
+        occupied = self.occupied ^ (1 << kingSq)
+        safe = 0
+        while targets:
+            toBit = targets & -targets
+            targets ^= toBit
+            if self.attackersTo(toBit.bit_length() - 1, them, occupied) == 0:
+                safe |= toBit
+        self.addMoves(kingSq, safe, moves)
+
+    '''
+    Castling, only called when the king is not in check. Same rules as GameState.getCastleMoves, plus the rook has to be on its square
+    '''
+    def getBitboardCastleMoves(self, kingSq, us, them, moves):
+        r, c = SQUARES[kingSq]
+        rights = self.castlingRights
+        kingSide = rights & (ChessEngine.CASTLE_WKS if us == 'w' else ChessEngine.CASTLE_BKS)
+        queenSide = rights & (ChessEngine.CASTLE_WQS if us == 'w' else ChessEngine.CASTLE_BQS)
+        rooks = self.bitboards[us + 'R']
+        occupied = self.occupied
+        if kingSide and c + 3 < 8 and rooks & (1 << (kingSq + 3)) and not occupied & (3 << (kingSq + 1)):
+            if not self.attackersTo(kingSq + 1, them, occupied) and not self.attackersTo(kingSq + 2, them, occupied):
+                moves.append(Move(kingSq, kingSq + 2, self.squares, isCastleMove=True))
+        if queenSide and c - 4 >= 0 and rooks & (1 << (kingSq - 4)) and not occupied & (7 << (kingSq - 3)):
+            if not self.attackersTo(kingSq - 1, them, occupied) and not self.attackersTo(kingSq - 2, them, occupied):
+                moves.append(Move(kingSq, kingSq - 2, self.squares, isCastleMove=True))
@@ -0,0 +1,173 @@
+#Opening book. The book is a binary file of fixed size (position key, move, weight) records sorted by key, opened with mmap
+#and searched by binary search, so nothing is read at startup however big the book is. Position keys are GameState.zobristKey,
+#so a book only works with the Zobrist tables of the ChessEngine that built it.
+#
+#   python Chess/ChessBook.py games.pgn more_games.pgn          build Chess/book.bin from game records
+#   python Chess/ChessBook.py lines.txt --max-ply 12 --out my.bin
+#
+#Game records are PGN files, or text files with one game per line in coordinate notation ("e2e4 e7e5 g1f3").
+import mmap
+import os
+import random
+import struct
+import sys
+import ChessEngine
+
+RECORD = struct.Struct(">QHH") #key, moveID, weight. Big-endian, so the records sort by key as plain bytes too
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+MAX_PLY = 20 #only the first moves of every game go into the book
+MIN_COUNT = 2 #a move has to be played at least this often in a position to make it into the book
+MAX_WEIGHT = 65535
+
+class OpeningBook():
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size // RECORD.size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else None #mmap can't map an empty file
+
+    '''
+    All the book moves for a position as a list of (moveID, weight), empty if the position isn't in the book
+    '''
+    def probe(self, key):
+        data = self.data
+        low, high = 0, self.size
+        while low < high: #find the first record with this key
+            mid = (low + high) // 2
+            if RECORD.unpack_from(data, mid * RECORD.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        entries = []
+        while low < self.size:
+            recordKey, moveID, weight = RECORD.unpack_from(data, low * RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((moveID, weight))
+            low += 1
+        return entries
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+openingBook = None
+bookPath = None
+
+'''
+The opening book in BOOK_FILE, opened the first time it is needed. None if there is no book yet, in which case the next call
+looks for the file again, so a book built later in the same process is picked up
+'''
+def getBook():
+    global openingBook, bookPath
+    if bookPath != BOOK_FILE or openingBook is None: #not opened yet, or BOOK_FILE was pointed at another book
+        if openingBook is not None:
+            openingBook.close()
+        openingBook = OpeningBook(BOOK_FILE) if os.path.exists(BOOK_FILE) else None
+        bookPath = BOOK_FILE
+    return openingBook
+
+'''
+Pick a book move for the position, at random with the book weights. Returns None when the position isn't in the book
+'''
+def getBookMove(gs, validMoves):
+    book = getBook()
+    if book is None:
+        return None
+    movesByID = {move.moveID: move for move in validMoves}
+    entries = [(movesByID[moveID], weight) for moveID, weight in book.probe(gs.zobristKey) if moveID in movesByID and weight > 0]
+    if not entries:
+        return None
+    return random.choices([move for move, weight in entries], weights=[weight for move, weight in entries])[0]
+
+'''
+Split PGN text into games, returning a list of (list of moves in SAN, result). Comments, variations and move numbers are dropped
+'''
+def readPGN(text):
+    import re #only building a book needs it
+    games = []
+    for movetext in re.split(r"(?:^\[.*\]\s*$\n?)+", text, flags=re.M):
+        movetext = re.sub(r"\{[^}]*\}|;[^\n]*", " ", movetext) #comments
+        while "(" in movetext: #variations, innermost first
+            movetext, count = re.subn(r"\([^()]*\)", " ", movetext)
+            if count == 0:
+                break
+        tokens = [token for token in movetext.split() if not token.startswith("$")] #drop NAGs
+        moves = []
+        result = "*"
+        for token in tokens:
+            if token in ("1-0", "0-1", "1/2-1/2", "*"):
+                result = token
+                break
+            token = re.sub(r"^\d+\.+", "", token) #move numbers, also when written together with the move ("1.e4")
+            if token:
+                moves.append(token)
+        if moves:
+            games.append((moves, result))
+    return games
+
+'''
+Games from a file of one game per line in coordinate notation, with no result
+'''
+def readLines(text):
+    return [(line.split(), "*") for line in text.splitlines() if line.strip() and not line.startswith("#")]
+
+'''
+Count how often every move was played in every position over the first maxPly plies of the games. The weight of a move is
+2 for every game the side playing it won, 1 for every draw or unknown result and nothing for a loss.
+Returns the sorted list of (key, moveID, weight) records
+'''
+def buildBook(games, maxPly=MAX_PLY, minCount=MIN_COUNT):
+    counts = {}
+    weights = {}
+    for moves, result in games:
+        gs = ChessEngine.GameState()
+        for text in moves[:maxPly]:
+            move = ChessEngine.parseMove(text, gs.getValidMoves())
+            if move is None: #illegal, or a promotion to something other than a queen, the rest of the game can't be followed
+                break
+            if result == "1-0":
+                weight = 2 if gs.whiteToMove else 0
+            elif result == "0-1":
+                weight = 0 if gs.whiteToMove else 2
+            else:
+                weight = 1
+            entry = (gs.zobristKey, move.moveID)
+            counts[entry] = counts.get(entry, 0) + 1
+            weights[entry] = weights.get(entry, 0) + weight
+            gs.makeMove(move)
+    return sorted((key, moveID, min(weights[(key, moveID)], MAX_WEIGHT)) for key, moveID in counts if counts[(key, moveID)] >= minCount)
+
+'''
+Write the records to a book file. If getBook has that file open it is closed first, the next getBook opens the new book
+'''
+def writeBook(path, records):
+    global openingBook, bookPath
+    if openingBook is not None and os.path.abspath(path) == os.path.abspath(bookPath):
+        openingBook.close() #rewriting a memory-mapped file under the map isn't safe
+        openingBook = bookPath = None
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(RECORD.pack(*record))
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the binary opening book for ChessAI from game records.")
+    parser.add_argument("games", nargs="+", help="PGN files, or text files with one game per line in coordinate notation")
+    parser.add_argument("--out", default=BOOK_FILE, help="book file to write")
+    parser.add_argument("--max-ply", type=int, default=MAX_PLY, help="plies of every game that go into the book")
+    parser.add_argument("--min-count", type=int, default=MIN_COUNT, help="times a move has to be played in a position to be kept")
+    args = parser.parse_args(argv)
+
+    games = []
+    for path in args.games:
+        with open(path) as f:
+            text = f.read()
+        games += readPGN(text) if path.lower().endswith(".pgn") else readLines(text)
+    records = buildBook(games, args.max_ply, args.min_count)
+    writeBook(args.out, records)
+    print("%d games, %d positions, %d book moves written to %s" % (len(games), len({record[0] for record in records}), len(records), args.out))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#EPD test-suite runner. Reads positions with best move (bm) and avoid move (am) operations, searches every position under
+#a time or node budget in parallel worker processes and reports which ones the engine solved, how long it took to settle
+#on a solution and how many nodes it searched.
+#
+#   python Chess/ChessEPD.py wac.epd --time 2                 two seconds per position
+#   python Chess/ChessEPD.py wac.epd sts1.epd --nodes 200000 --workers 8 --backend bitboard
+#
+#An EPD line is a FEN without the move counters followed by operations, e.g.
+#   2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - bm Qg6; id "WAC.001";
+#A position is solved when the search ends on one of its bm moves and on none of its am moves.
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import ChessEngine
+import ChessAI
+
+TIME_LIMIT = 1.0 #seconds per position when neither --time nor --nodes is given
+
+'''
+Split an EPD line into (FEN, operations). The operations are a dict of opcode -> list of operands, quotes taken off.
+The hmvc and fmvn operations, if there are any, become the move counters of the FEN
+'''
+def parseEPD(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("EPD needs at least 4 fields: " + line)
+    operations = {}
+    tokens = []
+    token = ""
+    quoted = False
+    for char in fields[4] if len(fields) > 4 else "":
+        if char == '"':
+            quoted = not quoted
+            if not quoted: #a quoted operand is kept even when it is empty
+                tokens.append(token)
+                token = ""
+        elif quoted or char not in " \t;":
+            token += char
+        else:
+            if token:
+                tokens.append(token)
+                token = ""
+            if char == ";" and tokens: #end of an operation
+                operations[tokens[0]] = tokens[1:]
+                tokens = []
+    if quoted:
+        raise ValueError("unterminated string in EPD: " + line)
+    if token:
+        tokens.append(token)
+    if tokens:
+        operations[tokens[0]] = tokens[1:]
+    counters = [operations.get("hmvc", ["0"])[0], operations.get("fmvn", ["1"])[0]]
+    return " ".join(fields[:4] + counters), operations
+
+'''
+Read the positions of an EPD file. Returns a list of (name, FEN, bm moveIDs, am moveIDs), the name is the id operation
+or the file and line number. Raises ValueError for lines that can't be used
+'''
+def loadSuite(path):
+    positions = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            where = "%s:%d" % (os.path.basename(path), number)
+            try:
+                fen, operations = parseEPD(line)
+                gs = ChessEngine.GameState()
+                gs.loadFEN(fen)
+            except ValueError as e:
+                raise ValueError(where + ": " + str(e))
+            validMoves = gs.getValidMoves()
+            moveIDs = {}
+            for opcode in ("bm", "am"):
+                moveIDs[opcode] = []
+                for text in operations.get(opcode, []):
+                    move = ChessEngine.parseMove(text, validMoves)
+                    if move is None:
+                        raise ValueError(where + ": " + opcode + " move " + text + " is not legal here")
+                    moveIDs[opcode].append(move.moveID)
+            if not moveIDs["bm"] and not moveIDs["am"]:
+                raise ValueError(where + ": no bm or am operation")
+            name = operations["id"][0] if operations.get("id") else where
+            positions.append((name, fen, moveIDs["bm"], moveIDs["am"]))
+    return positions
+
+'''
+Search one position in a worker process with a fresh transposition table, so the results don't depend on which positions
+the worker searched before. Returns a dict with the move found, whether it solves the position, and the depth, time and
+nodes of the iteration from which on every iteration found a solving move (None if the last one didn't)
+'''
+def solvePosition(index, backend, fen, bestMoveIDs, avoidMoveIDs, timeLimit, nodeLimit, maxDepth):
+    ChessEngine.BACKEND = backend
+    ChessAI.transpositionTable = ChessAI.TranspositionTable()
+    gs = ChessEngine.newGameState()
+    gs.loadFEN(fen)
+    validMoves = gs.getValidMoves()
+    sanMoves = {move.moveID: move.getSAN(validMoves) for move in validMoves}
+    start = time.perf_counter()
+    iterations = ChessAI.searchIterations(gs, list(validMoves), timeLimit, nodeLimit, maxDepth)
+    seconds = time.perf_counter() - start
+    solved = None
+    for iteration in iterations:
+        moveID = iteration[2].moveID
+        if (not bestMoveIDs or moveID in bestMoveIDs) and moveID not in avoidMoveIDs:
+            if solved is None:
+                solved = iteration
+        else:
+            solved = None
+    depth, score, move = iterations[-1][:3]
+    return {"index": index, "move": sanMoves[move.moveID], "depth": depth, "score": score, "nodes": ChessAI.searchNodes,
+            "seconds": seconds, "solved": solved is not None, "solvedDepth": solved[0] if solved else None,
+            "solvedNodes": solved[3] if solved else None, "solvedSeconds": solved[4] if solved else None}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run EPD test suites (bm/am) against the ChessAI search.")
+    parser.add_argument("suites", nargs="+", help="EPD files")
+    parser.add_argument("--time", type=float, help="seconds per position (default %g when --nodes isn't given either)" % TIME_LIMIT)
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--depth", type=int, default=ChessAI.MAX_DEPTH, help="deepest iteration")
+    parser.add_argument("--backend", default=ChessEngine.BACKEND, choices=["mailbox", "bitboard"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="positions searched at the same time")
+    args = parser.parse_args(argv)
+    timeLimit = args.time if args.time is not None or args.nodes is not None else TIME_LIMIT
+
+    positions = []
+    try:
+        for path in args.suites:
+            positions += loadSuite(path)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    results = [None] * len(positions)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(solvePosition, i, args.backend, fen, bestMoveIDs, avoidMoveIDs, timeLimit, args.nodes, args.depth)
+                   for i, (name, fen, bestMoveIDs, avoidMoveIDs) in enumerate(positions)]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result["index"]] = result
+            if result["solved"]:
+                solution = "solved at depth %d in %.2fs, %d nodes" % (result["solvedDepth"], result["solvedSeconds"], result["solvedNodes"])
+            else:
+                solution = "FAIL"
+            print("%-20s %-8s depth %2d  %9d nodes  %6.2fs  %s" % (positions[result["index"]][0], result["move"], result["depth"],
+                  result["nodes"], result["seconds"], solution))
+            sys.stdout.flush()
+
+    solved = [result for result in results if result["solved"]]
+    nodes = sum(result["nodes"] for result in results)
+    seconds = sum(result["seconds"] for result in results)
+    print("solved %d of %d in %.1fs wall clock" % (len(solved), len(results), time.perf_counter() - start))
+    if solved:
+        print("average time to solution %.2fs, %d nodes" % (sum(result["solvedSeconds"] for result in solved) / len(solved),
+              sum(result["solvedNodes"] for result in solved) // len(solved)))
+    print("%d nodes searched, %.0f nodes/sec per worker" % (nodes, nodes / max(seconds, 1e-9)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,77 @@
 #This is our main driver file. It will be responsible for handling user input and displaying the current GameState object.
+import random
+import ChessEval
+
+BACKEND = "mailbox" #which GameState newGameState() builds: "mailbox" (the 8x8 board below) or "bitboard" (ChessBitboard)
+
+'''
+Create a GameState using the backend picked by BACKEND
+'''
+def newGameState():
+    if BACKEND == "bitboard":
+        import ChessBitboard #imported here because ChessBitboard builds on this module
+        return ChessBitboard.GameState()
+    return GameState()
+
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)) #orthogonal first, then diagonal
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+'''
+For every square, the on-board squares reached by adding each offset. Indexed as table[row][col]
+'''
+def buildSquareTable(offsets):
+    return [[[(r + dr, c + dc) for dr, dc in offsets if 0 <= r + dr < 8 and 0 <= c + dc < 8] for c in range(8)] for r in range(8)]
+
+#precomputed attack tables, so attack detection only has to look up squares instead of working them out every time
+KNIGHT_TABLE = buildSquareTable(KNIGHT_OFFSETS)
+KING_TABLE = buildSquareTable(DIRECTIONS)
+PAWN_ATTACKER_TABLE = {'w': buildSquareTable(((1, -1), (1, 1))), 'b': buildSquareTable(((-1, -1), (-1, 1)))} #where a pawn of that color has to stand to attack the square
+#Zobrist keys: one random 64-bit number per piece per square, for black to move, each castling right and each en passant file.
+#A position's key is the xor of the numbers for everything in it, so a move only has to xor the parts it changes
+zobristRandom = random.Random(20240813) #fixed seed so keys are the same in every process
+ZOBRIST_PIECES = {piece: [[zobristRandom.getrandbits(64) for c in range(8)] for r in range(8)] for piece in ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")}
+ZOBRIST_PIECES["--"] = [[0] * 8 for r in range(8)] #empty squares don't change the key
+ZOBRIST_BLACK_TO_MOVE = zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [zobristRandom.getrandbits(64) for i in range(4)] #wks, bks, wqs, bqs
+ZOBRIST_ENPASSANT = [zobristRandom.getrandbits(64) for c in range(8)] #by file of the en passant square
+
+#castling rights are a 4-bit mask, one bit per right in the same order as ZOBRIST_CASTLING
+CASTLE_WKS, CASTLE_BKS, CASTLE_WQS, CASTLE_BQS = 1, 2, 4, 8
+CASTLE_ALL = 15
+ZOBRIST_CASTLING_KEYS = [0] * 16 #xor of the keys of the rights in every mask
+for rights in range(16):
+    for i in range(4):
+        if rights & (1 << i):
+            ZOBRIST_CASTLING_KEYS[rights] ^= ZOBRIST_CASTLING[i]
+#the rights that survive a move from or to each square: moving the king or a rook, or capturing a rook on its corner, loses them.
+#A move's new rights are the old ones and-ed with the masks of its start and end squares
+CASTLE_MASKS = [[CASTLE_ALL] * 8 for r in range(8)]
+CASTLE_MASKS[7][4] = CASTLE_ALL & ~(CASTLE_WKS | CASTLE_WQS)
+CASTLE_MASKS[7][7] = CASTLE_ALL & ~CASTLE_WKS
+CASTLE_MASKS[7][0] = CASTLE_ALL & ~CASTLE_WQS
+CASTLE_MASKS[0][4] = CASTLE_ALL & ~(CASTLE_BKS | CASTLE_BQS)
+CASTLE_MASKS[0][7] = CASTLE_ALL & ~CASTLE_BKS
+CASTLE_MASKS[0][0] = CASTLE_ALL & ~CASTLE_BQS
+ENPASSANT_SQUARES = ([(5, c) for c in range(8)], [(2, c) for c in range(8)]) #by whiteToMove then file, so no tuple is made per move
+
+#The state a move can't be worked out backwards from is saved before every move as one packed integer on GameState.undoStack:
+#castling mask, en passant file + 1 (0 for none), captured piece, halfmove clock, and the Zobrist key in the high bits
+UNDO_EP_SHIFT = 4
+UNDO_CAPTURED_SHIFT = 8
+UNDO_CLOCK_SHIFT = 12
+UNDO_KEY_SHIFT = 32
+UNDO_CLOCK_MASK = (1 << (UNDO_KEY_SHIFT - UNDO_CLOCK_SHIFT)) - 1
+UNDO_STACK_SIZE = 512 #plies preallocated, the stack doubles if a game gets longer
+FIFTY_MOVE_PLIES = 100 #a game is drawn once this many plies go by without a capture or pawn move
+REPETITION_DRAW = 3 #a game is drawn once the same position comes up this many times
+PIECE_NAMES = ("--", "wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")
+PIECE_INDEX = {piece: i for i, piece in enumerate(PIECE_NAMES)}
+
+RAY_TABLE = [[[[(r + d[0]*i, c + d[1]*i) for i in range(1, 8) if 0 <= r + d[0]*i < 8 and 0 <= c + d[1]*i < 8] for d in DIRECTIONS] for c in range(8)] for r in range(8)] #squares along each direction, nearest first
 
 class GameState():
+    backend = "mailbox" #the BACKEND name that builds this class, so a copy can be set up in another process
+
     def __init__(self):
         #board is an 8x8 2d list, each element of the list has 2 characters.
         #the first character represents the color of the piece, 'b' or 'w'
@@ -24,10 +95,15 @@ class GameState():
         self.checkMate = False
         self.staleMate = False
         self.enpassantPossible = () #coordinates for the square where en-passant capture is possible
-        self.enpassantPossibleLog = [self.enpassantPossible]
-        self.currentCastlingRight = CastleRight(True, True, True, True) #initialize the castling rights
-        self.castleRightsLog = [CastleRight(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                           self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        self.castlingRights = CASTLE_ALL #mask of CASTLE_WKS, CASTLE_BKS, CASTLE_WQS and CASTLE_BQS
+        self.undoStack = [0] * UNDO_STACK_SIZE #packed irreversible state from before each move in moveLog, see UNDO_KEY_SHIFT
+        self.pins = None #pinned pieces while getValidMoves is generating legal moves, None for pseudo-legal generation
+        self.zobristKey = self.computeZobristKey() #64-bit key identifying the position, kept up to date by makeMove/undoMove
+        self.positionCounts = {self.zobristKey: 1} #key -> times the position occurred in moveLog, for repetition detection
+        self.mgScore, self.egScore, self.phase = self.computeEvaluationTerms() #running evaluation, kept up to date by makeMove/undoMove
+        self.pieceCount = 32 #pieces on the board, kings included, so the search knows when a tablebase can answer
+        self.halfmoveClock = 0 #plies since the last capture or pawn move, for the fifty-move rule
+        self.fullmoveNumber = 1 #starts at 1 and goes up after every black move
         
 
     
@@ -35,6 +111,25 @@ class GameState():
     Takes a Move as a parameter and executes it. This will not work for castling, pawn promotion, and en-passant
     '''   
     def makeMove(self, move):
+        #save what undoMove can't work out from the move, packed into one integer
+        rights = self.castlingRights
+        ply = len(self.moveLog)
+        if ply == len(self.undoStack):
+            self.undoStack.extend([0] * len(self.undoStack))
+        enpassantFile = self.enpassantPossible[1] + 1 if self.enpassantPossible != () else 0
+        self.undoStack[ply] = (self.zobristKey << UNDO_KEY_SHIFT | self.halfmoveClock << UNDO_CLOCK_SHIFT
+                               | PIECE_INDEX[move.pieceCaptured] << UNDO_CAPTURED_SHIFT | enpassantFile << UNDO_EP_SHIFT | rights)
+        #take the old en passant file and castling rights out of the key, the new ones go back in at the end
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_CASTLING_KEYS[rights]
+        if enpassantFile:
+            key ^= ZOBRIST_ENPASSANT[enpassantFile - 1]
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow][move.startCol]
+        captureRow = move.startRow if move.isEnpassantMove else move.endRow #the en passant victim sits beside the moving pawn
+        key ^= ZOBRIST_PIECES[move.pieceCaptured][captureRow][move.endCol]
+        #running evaluation: take out the moving piece and whatever it captured, the landing piece is added at the end
+        mgScore = self.mgScore - ChessEval.SCORE_MG[move.pieceMoved][move.startRow][move.startCol] - ChessEval.SCORE_MG[move.pieceCaptured][captureRow][move.endCol]
+        egScore = self.egScore - ChessEval.SCORE_EG[move.pieceMoved][move.startRow][move.startCol] - ChessEval.SCORE_EG[move.pieceCaptured][captureRow][move.endCol]
+        phase = self.phase - ChessEval.PHASE_WEIGHTS[move.pieceMoved[1]] - ChessEval.PHASE_WEIGHTS[move.pieceCaptured[1]]
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move) #log the move so we can undo it later
@@ -52,24 +147,42 @@ class GameState():
             self.board[move.startRow][move.endCol] = "--" #capturing the pawn, it is located at the startRow of the pawn that moved, and the endCol of the pawn that was captured
         #update enpassantPossible variable
         if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2: #only on 2 square pawn advances
-            self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol) #the square where the pawn can be captured
+            self.enpassantPossible = ENPASSANT_SQUARES[self.whiteToMove][move.startCol] #the square where the pawn can be captured
         else:
             self.enpassantPossible = ()
         #castle move
         if move.isCastleMove:
             if move.endCol - move.startCol == 2: #kingside castle
-                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1] #move the rook, the king is already moved
-                self.board[move.endRow][move.endCol+1] = "--" #erase the rook from the old square
+                rookFrom, rookTo = move.endCol+1, move.endCol-1
             else: #queenside castle
-                self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2]
-                self.board[move.endRow][move.endCol-2] = "--"  #erase the rook from the old square
+                rookFrom, rookTo = move.endCol-2, move.endCol+1
+            rook = self.board[move.endRow][rookFrom]
+            self.board[move.endRow][rookTo] = rook #move the rook, the king is already moved
+            self.board[move.endRow][rookFrom] = "--" #erase the rook from the old square
+            key ^= ZOBRIST_PIECES[rook][move.endRow][rookFrom] ^ ZOBRIST_PIECES[rook][move.endRow][rookTo]
+            mgScore += ChessEval.SCORE_MG[rook][move.endRow][rookTo] - ChessEval.SCORE_MG[rook][move.endRow][rookFrom]
+            egScore += ChessEval.SCORE_EG[rook][move.endRow][rookTo] - ChessEval.SCORE_EG[rook][move.endRow][rookFrom]
 
-        self.enpassantPossibleLog.append(self.enpassantPossible) #update the enpassantPossibleLog
+        #update castling rights - whenever a king or rook moves, or a rook is captured
+        rights &= CASTLE_MASKS[move.startRow][move.startCol] & CASTLE_MASKS[move.endRow][move.endCol]
+        self.castlingRights = rights
 
-        #update castling rights - whenever it is a rook or a king move
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRight(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                                self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        #the piece that lands (the queen after a promotion), the new castling rights and en passant file
+        landed = self.board[move.endRow][move.endCol]
+        key ^= ZOBRIST_PIECES[landed][move.endRow][move.endCol] ^ ZOBRIST_CASTLING_KEYS[rights]
+        if self.enpassantPossible != ():
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        self.zobristKey = key
+        counts = self.positionCounts
+        counts[key] = counts.get(key, 0) + 1
+        self.mgScore = mgScore + ChessEval.SCORE_MG[landed][move.endRow][move.endCol]
+        self.egScore = egScore + ChessEval.SCORE_EG[landed][move.endRow][move.endCol]
+        self.phase = phase + ChessEval.PHASE_WEIGHTS[landed[1]]
+        if move.pieceCaptured != "--":
+            self.pieceCount -= 1
+        self.halfmoveClock = 0 if move.pieceCaptured != "--" or move.pieceMoved[1] == 'p' else self.halfmoveClock + 1
+        if self.whiteToMove: #black just moved
+            self.fullmoveNumber += 1
 
     '''
     Undo the last move made
@@ -77,8 +190,16 @@ class GameState():
     def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
+            state = self.undoStack[len(self.moveLog)]
+            captured = PIECE_NAMES[state >> UNDO_CAPTURED_SHIFT & 15]
+            #running evaluation: the reverse of makeMove, take out the landed piece and put back the moved and captured pieces
+            landed = self.board[move.endRow][move.endCol]
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            self.mgScore += ChessEval.SCORE_MG[move.pieceMoved][move.startRow][move.startCol] + ChessEval.SCORE_MG[captured][captureRow][move.endCol] - ChessEval.SCORE_MG[landed][move.endRow][move.endCol]
+            self.egScore += ChessEval.SCORE_EG[move.pieceMoved][move.startRow][move.startCol] + ChessEval.SCORE_EG[captured][captureRow][move.endCol] - ChessEval.SCORE_EG[landed][move.endRow][move.endCol]
+            self.phase += ChessEval.PHASE_WEIGHTS[move.pieceMoved[1]] + ChessEval.PHASE_WEIGHTS[captured[1]] - ChessEval.PHASE_WEIGHTS[landed[1]]
             self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            self.board[move.endRow][move.endCol] = captured
             self.whiteToMove = not self.whiteToMove #switch turns back
             #update the king's location if needed
             if move.pieceMoved == 'wK':
@@ -88,82 +209,309 @@ class GameState():
             #undo en passant
             if move.isEnpassantMove:
                 self.board[move.endRow][move.endCol] = "--" #leave landing square blank
-                self.board[move.startRow][move.endCol] = move.pieceCaptured #put the enemy pawn back
-            
-            self.enpassantPossibleLog.pop() #get rid of the new enpassant rights from the move we are undoing
-            self.enpassantPossible = self.enpassantPossibleLog[-1] #set the current enpassant rights to the last one in the list
+                self.board[move.startRow][move.endCol] = captured #put the enemy pawn back
 
-            #undo castling rights
-            self.castleRightsLog.pop() #get rid of the new castle rights from the move we are undoing
-            newRights = self.castleRightsLog[-1] #set the current castling rights to the last one in the list
-            self.currentCastlingRight = CastleRight(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs)
+            #the en passant square, castling rights, halfmove clock and key from before the move come off the undo stack
+            enpassantFile = state >> UNDO_EP_SHIFT & 15
+            self.enpassantPossible = ENPASSANT_SQUARES[self.whiteToMove][enpassantFile - 1] if enpassantFile else ()
+            self.castlingRights = state & CASTLE_ALL
+            counts = self.positionCounts
+            count = counts[self.zobristKey]
+            if count == 1:
+                del counts[self.zobristKey] #keep the dict to the positions still on the board's history, not every position searched
+            else:
+                counts[self.zobristKey] = count - 1
+            self.zobristKey = state >> UNDO_KEY_SHIFT #no need to xor everything back out
+            if captured != "--":
+                self.pieceCount += 1
+            self.halfmoveClock = state >> UNDO_CLOCK_SHIFT & UNDO_CLOCK_MASK
+            if not self.whiteToMove: #taking back a black move
+                self.fullmoveNumber -= 1
             #undo castle move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2: #kingside
-                    self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-1] 
-                    self.board[move.endRow][move.endCol-1] = "--" 
+                    rookFrom, rookTo = move.endCol+1, move.endCol-1
                 else: #queenside
-                    self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
-                    self.board[move.endRow][move.endCol+1] = "--"
+                    rookFrom, rookTo = move.endCol-2, move.endCol+1
+                rook = self.board[move.endRow][rookTo]
+                self.board[move.endRow][rookFrom] = rook
+                self.board[move.endRow][rookTo] = "--"
+                self.mgScore += ChessEval.SCORE_MG[rook][move.endRow][rookFrom] - ChessEval.SCORE_MG[rook][move.endRow][rookTo]
+                self.egScore += ChessEval.SCORE_EG[rook][move.endRow][rookFrom] - ChessEval.SCORE_EG[rook][move.endRow][rookTo]
             #update the checkmate and stalemate variables
             self.checkMate = False
             self.staleMate = False
             
 
     '''
-    Update the castling rights given the move
+    Set up the position from a FEN string (piece placement, side to move, castling rights, en passant square, halfmove clock, fullmove number).
+    The two move counters may be left out, as they are in EPD. The move log and all the running state start over from this position
     '''
-    def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == 'bK':
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == 'wR':
-            if move.startRow == 7: 
-                if move.startCol == 0: #left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7: #right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == 'bR':
-            if move.startRow == 0: 
-                if move.startCol == 0: #left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7: #right rook
-                    self.currentCastlingRight.bks = False
-    '''
-    All moves considering checks
+    def loadFEN(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        rows = fields[0].split('/')
+        if len(rows) != 8:
+            raise ValueError("FEN needs 8 rows: " + fen)
+        if fields[1] not in ('w', 'b'):
+            raise ValueError("side to move must be w or b: " + fen)
+        if fields[2] != '-' and (fields[2].strip("KQkq") != "" or len(set(fields[2])) != len(fields[2])):
+            raise ValueError("bad castling rights '" + fields[2] + "' in FEN: " + fen)
+        #the en passant square is behind the pawn that just moved two squares, so rank 6 with white to move and rank 3 with black
+        if fields[3] != '-' and (len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or fields[3][1] != ('6' if fields[1] == 'w' else '3')):
+            raise ValueError("bad en passant square '" + fields[3] + "' in FEN: " + fen)
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("move counters must be numbers: " + fen)
+        if not 0 <= halfmoveClock <= UNDO_CLOCK_MASK // 2 or fullmoveNumber < 1: #the clock has to keep fitting in its bits of the undo stack
+            raise ValueError("move counters out of range: " + fen)
+        board = []
+        for row in rows:
+            boardRow = []
+            for char in row:
+                if char.isdigit():
+                    boardRow.extend(["--"] * int(char)) #a digit counts empty squares
+                elif char.upper() in "PRNBQK":
+                    pieceType = 'p' if char in "Pp" else char.upper()
+                    boardRow.append(('w' if char.isupper() else 'b') + pieceType)
+                else:
+                    raise ValueError("unknown piece '" + char + "' in FEN: " + fen)
+            if len(boardRow) != 8:
+                raise ValueError("FEN row '" + row + "' is not 8 squares long")
+            board.append(boardRow)
+        if sum(row.count('wK') for row in board) != 1 or sum(row.count('bK') for row in board) != 1:
+            raise ValueError("FEN needs exactly one king of each color: " + fen)
+        self.board = board
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == 'wK':
+                    self.whiteKingLocation = (r, c)
+                elif board[r][c] == 'bK':
+                    self.blackKingLocation = (r, c)
+        self.whiteToMove = fields[1] == 'w'
+        #a right only counts while its king and rook are on their starting squares, so makeMove can clear rights by square alone
+        rights = 0
+        for char, right, row, rookCol, color in (('K', CASTLE_WKS, 7, 7, 'w'), ('k', CASTLE_BKS, 0, 7, 'b'),
+                                                 ('Q', CASTLE_WQS, 7, 0, 'w'), ('q', CASTLE_BQS, 0, 0, 'b')):
+            if char in fields[2] and board[row][4] == color + 'K' and board[row][rookCol] == color + 'R':
+                rights |= right
+        self.castlingRights = rights
+        enpassant = fields[3]
+        self.enpassantPossible = () if enpassant == '-' else (Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]])
+        self.moveLog = []
+        self.checkMate = False
+        self.staleMate = False
+        self.zobristKey = self.computeZobristKey()
+        self.positionCounts = {self.zobristKey: 1}
+        self.mgScore, self.egScore, self.phase = self.computeEvaluationTerms()
+        self.pieceCount = sum(square != "--" for row in board for square in row)
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+
+    '''
+    Keys of the positions since the last capture or pawn move, oldest first and without the current one. No position from before
+    an irreversible move can come back, so these are all a copy set up with loadFEN needs to detect repetitions
+    '''
+    def getRepetitionHistory(self):
+        start = max(0, len(self.moveLog) - self.halfmoveClock)
+        return [self.undoStack[i] >> UNDO_KEY_SHIFT for i in range(start, len(self.moveLog))]
+
+    '''
+    Count the keys from another GameState's getRepetitionHistory as positions played before this one. Call it after loadFEN
+    '''
+    def setRepetitionHistory(self, keys):
+        for key in keys:
+            self.positionCounts[key] = self.positionCounts.get(key, 0) + 1
+
+    '''
+    Times the current position has occurred, this time included. Only positions since the last capture or pawn move can match,
+    because anything older has different pawns, pieces or castling rights, so counting over the whole game answers in constant time
+    '''
+    def repetitionCount(self):
+        return self.positionCounts.get(self.zobristKey, 0)
+
+    '''
+    Whether the game is drawn by threefold repetition or the fifty-move rule. A checkmate on the fiftieth move still wins,
+    so look at checkMate first
+    '''
+    def isDrawByRule(self):
+        return self.halfmoveClock >= FIFTY_MOVE_PLIES or self.repetitionCount() >= REPETITION_DRAW
+
+    '''
+    The position as a FEN string, the reverse of loadFEN
+    '''
+    def getFEN(self):
+        rows = []
+        for row in self.board:
+            text = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                char = 'P' if square[1] == 'p' else square[1]
+                text += char if square[0] == 'w' else char.lower()
+            if empty:
+                text += str(empty)
+            rows.append(text)
+        rights = self.castlingRights
+        castling = ("K" if rights & CASTLE_WKS else "") + ("Q" if rights & CASTLE_WQS else "") + ("k" if rights & CASTLE_BKS else "") + ("q" if rights & CASTLE_BQS else "")
+        if self.enpassantPossible == ():
+            enpassant = "-"
+        else:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        return " ".join(("/".join(rows), 'w' if self.whiteToMove else 'b', castling or "-", enpassant, str(self.halfmoveClock), str(self.fullmoveNumber)))
+
+    '''
+    Work out the Zobrist key of the current position from scratch
+    '''
+    def computeZobristKey(self):
+        key = ZOBRIST_CASTLING_KEYS[self.castlingRights]
+        for r in range(8):
+            for c in range(8):
+                key ^= ZOBRIST_PIECES[self.board[r][c]][r][c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.enpassantPossible != ():
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        return key
+
+    '''
+    Work out the middlegame score, endgame score and game phase of the current position from scratch
+    '''
+    def computeEvaluationTerms(self):
+        mgScore = egScore = phase = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                mgScore += ChessEval.SCORE_MG[piece][r][c]
+                egScore += ChessEval.SCORE_EG[piece][r][c]
+                phase += ChessEval.PHASE_WEIGHTS[piece[1]]
+        return mgScore, egScore, phase
+
+    '''
+    Static evaluation in centipawns from the running scores, positive is good for white. Takes the same time however many pieces are left
+    '''
+    def getEvaluation(self):
+        return ChessEval.taperedScore(self.mgScore, self.egScore, self.phase)
+
+    '''
+    All moves considering checks, and checkMate or staleMate set when there are none
     '''
     def getValidMoves(self):
-        tempEnpassantPossible = self.enpassantPossible #store the current enpassantPossible
-        tempCastleRights = CastleRight(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                       self.currentCastlingRight.wqs, self.currentCastlingRight.bqs) #store the current castling rights
-        #1. generate all possible moves
-        moves = self.getAllPossibleMoves()
-        if self.whiteToMove: #if it is white's turn
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves) #generate all possible castle moves
-        else:  #if it is black
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves) #generate all possible castle moves
-        #2. for each move, make the move
-        for i in range(len(moves) - 1, -1, -1): #when removing from a list, go backwards through that list, because the indices will change
-            self.makeMove(moves[i]) #make the move
-            #3. generate all opponent's moves
-            #4. for each of your opponent's moves, see if they attack your king
-            self.whiteToMove = not self.whiteToMove #switch to opponent's turn
-            if self.inCheck():
-                moves.remove(moves[i])  #5. if they do, not a valid move 
-            self.whiteToMove = not self.whiteToMove #switch turns back  
-            self.undoMove() #undo the move
+        moves = self.getLegalMoves()
         if len(moves) == 0:
             if self.inCheck():
                 self.checkMate = True
             else:
                 self.staleMate = True
-        self.enpassantPossible = tempEnpassantPossible #restore the enpassantPossible
-        self.currentCastlingRight = tempCastleRights
         return moves
-    
+
+    '''
+    All moves considering checks, without touching checkMate and staleMate. Checks and pins are found once by looking outward
+    from the king, so the piece generators only produce legal moves and nothing has to be made and undone
+    '''
+    def getLegalMoves(self):
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        inCheck, self.pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        if len(checks) > 1: #double check, only the king can move
+            moves = []
+            self.getKingMoves(kingRow, kingCol, moves)
+        else:
+            moves = self.getAllPossibleMoves()
+            if inCheck: #block the check, capture the checking piece or move the king
+                checkRow, checkCol, dRow, dCol = checks[0]
+                if self.board[checkRow][checkCol][1] == 'N': #a knight can't be blocked
+                    validSquares = {(checkRow, checkCol)}
+                else:
+                    validSquares = set()
+                    for i in range(1, 8):
+                        validSquare = (kingRow + dRow * i, kingCol + dCol * i)
+                        validSquares.add(validSquare)
+                        if validSquare == (checkRow, checkCol): #stop once we reach the checking piece
+                            break
+                #en passant moves were already tested for check when they were generated
+                moves = [move for move in moves if move.pieceMoved[1] == 'K' or move.isEnpassantMove or (move.endRow, move.endCol) in validSquares]
+        self.pins = None #back to plain pseudo-legal generation
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, moves)
+        return moves
+
+    '''
+    Look outward from the square r, c (normally the king of the player to move) for enemy pieces.
+    Returns if the square is attacked, the pins as {(row, col) of the pinned piece: pin direction} and the checks as a list of (row, col, dRow, dCol)
+    '''
+    def checkForPinsAndChecks(self, r, c):
+        pins = {}
+        checks = []
+        inCheck = False
+        allyColor = 'w' if self.whiteToMove else 'b'
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        board = self.board
+        rays = RAY_TABLE[r][c]
+        for j in range(8):
+            sliderType = 'R' if j <= 3 else 'B' #the sliding piece, besides the queen, that attacks along this direction
+            possiblePin = () #reset possible pins
+            for endRow, endCol in rays[j]:
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == allyColor:
+                    if possiblePin == (): #first allied piece could be pinned
+                        possiblePin = (endRow, endCol)
+                    else: #second allied piece, so no pin or check possible in this direction
+                        break
+                else:
+                    if endPiece[1] == sliderType or endPiece[1] == 'Q':
+                        if possiblePin == (): #no piece blocking, so it's a check
+                            inCheck = True
+                            checks.append((endRow, endCol, DIRECTIONS[j][0], DIRECTIONS[j][1]))
+                        else: #piece blocking, so it's a pin
+                            pins[possiblePin] = DIRECTIONS[j]
+                    break #enemy piece not applying check or pin
+        #pawns, knights and the enemy king only attack from fixed squares
+        for table, piece in ((PAWN_ATTACKER_TABLE[enemyColor], 'p'), (KNIGHT_TABLE, 'N'), (KING_TABLE, 'K')):
+            for endRow, endCol in table[r][c]:
+                if board[endRow][endCol] == enemyColor + piece:
+                    inCheck = True
+                    checks.append((endRow, endCol, endRow - r, endCol - c))
+        return inCheck, pins, checks
+
+    '''
+    Check if the piece at r, c may move in direction d. A pinned piece can only move along its pin
+    '''
+    def canMoveInDirection(self, r, c, d):
+        if not self.pins or (r, c) not in self.pins:
+            return True
+        pinDirection = self.pins[(r, c)]
+        return pinDirection == d or pinDirection == (-d[0], -d[1])
+
+    '''
+    An en passant capture takes two pawns off the same row, which can uncover a check that no pin covers.
+    Try it on the board and look for checks from the king
+    '''
+    def isEnpassantLegal(self, r, c, endRow, endCol):
+        pawn = self.board[r][c]
+        capturedPawn = self.board[r][endCol]
+        self.board[r][c] = "--"
+        self.board[r][endCol] = "--"
+        self.board[endRow][endCol] = pawn
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        inCheck = self.squareUnderAttack(kingRow, kingCol)
+        self.board[endRow][endCol] = "--" #put everything back
+        self.board[r][endCol] = capturedPawn
+        self.board[r][c] = pawn
+        return not inCheck
+
     '''
     Determine if the current player is in check
     '''
@@ -174,17 +522,25 @@ class GameState():
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
     
     '''
-    Determine if the enemy can attack the square r, c
+    Determine if the enemy can attack the square r, c. Looks outward from the square using the precomputed tables
+    and stops at the first piece on every ray, so no moves have to be generated
     '''
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove #switch to opponent's turn, because we are checking their moves
-        #3. generate all opponent's moves
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove #switch turns back, even if the square is not under attack
-        #4. for each of your opponent's moves, see if they attack your king
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c: #square is under attack, return True
-                return True
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        board = self.board
+        for table, piece in ((KNIGHT_TABLE, 'N'), (PAWN_ATTACKER_TABLE[enemyColor], 'p'), (KING_TABLE, 'K')):
+            for endRow, endCol in table[r][c]:
+                if board[endRow][endCol] == enemyColor + piece:
+                    return True
+        rays = RAY_TABLE[r][c]
+        for j in range(8):
+            sliderType = 'R' if j <= 3 else 'B'
+            for endRow, endCol in rays[j]:
+                endPiece = board[endRow][endCol]
+                if endPiece != "--": #first piece on the ray, nothing behind it can attack
+                    if endPiece[0] == enemyColor and (endPiece[1] == sliderType or endPiece[1] == 'Q'):
+                        return True
+                    break
         return False #square is not under attack
         
 
@@ -201,40 +557,180 @@ class GameState():
                     self.moveFunctions[piece](r, c, moves) #calls the appropriate move function based on piece type
         return moves
     
+    '''
+    Legal captures and promotions only, for the quiescence search. When in check every evasion is returned instead,
+    since standing pat isn't an option there
+    '''
+    def getCaptureMoves(self):
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        inCheck, pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        if inCheck:
+            return self.getLegalMoves()
+        allyColor = 'w' if self.whiteToMove else 'b'
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        moveAmount = -1 if self.whiteToMove else 1
+        board = self.board
+        moves = []
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != allyColor:
+                    continue
+                pieceType = piece[1]
+                pinDirection = pins.get((r, c))
+                if pieceType == 'p':
+                    endRow = r + moveAmount
+                    if (endRow == 0 or endRow == 7) and board[endRow][c] == "--" and (pinDirection is None or pinDirection[1] == 0): #promotion push
+                        moves.append(Move((r, c), (endRow, c), board))
+                    for dc in (-1, 1):
+                        endCol = c + dc
+                        if not 0 <= endCol <= 7 or (pinDirection is not None and pinDirection != (moveAmount, dc) and pinDirection != (-moveAmount, -dc)):
+                            continue
+                        if board[endRow][endCol][0] == enemyColor:
+                            moves.append(Move((r, c), (endRow, endCol), board))
+                        elif (endRow, endCol) == self.enpassantPossible and self.isEnpassantLegal(r, c, endRow, endCol):
+                            moves.append(Move((r, c), (endRow, endCol), board, isEnpassantMove=True))
+                elif pieceType == 'N':
+                    if pinDirection is None: #a pinned knight can never move
+                        for endRow, endCol in KNIGHT_TABLE[r][c]:
+                            if board[endRow][endCol][0] == enemyColor:
+                                moves.append(Move((r, c), (endRow, endCol), board))
+                elif pieceType == 'K':
+                    for endRow, endCol in KING_TABLE[r][c]:
+                        if board[endRow][endCol][0] == enemyColor:
+                            board[r][c] = "--" #same as getKingMoves, the king can't hide behind itself
+                            safe = not self.squareUnderAttack(endRow, endCol)
+                            board[r][c] = piece
+                            if safe:
+                                moves.append(Move((r, c), (endRow, endCol), board))
+                else: #rook, bishop or queen, the first piece on each ray is the only one it can capture
+                    rays = RAY_TABLE[r][c]
+                    for j in (range(4) if pieceType == 'R' else range(4, 8) if pieceType == 'B' else range(8)):
+                        d = DIRECTIONS[j]
+                        if pinDirection is not None and pinDirection != d and pinDirection != (-d[0], -d[1]):
+                            continue
+                        for endRow, endCol in rays[j]:
+                            endPiece = board[endRow][endCol]
+                            if endPiece != "--":
+                                if endPiece[0] == enemyColor:
+                                    moves.append(Move((r, c), (endRow, endCol), board))
+                                break
+        return moves
+
+    '''
+    Legal moves handed out in stages for the search: the hash move, captures and promotions, quiet moves, then castling.
+    A stage is only generated once the one before it is used up, so when the search cuts off early the later stages are never built.
+    orderStage(moves), if given, sorts each stage in place before it is handed out. Quiet moves come from the pseudo-legal generator
+    and are checked one at a time as they are consumed. Unlike getValidMoves this doesn't set checkMate or staleMate
+    '''
+    def getStagedMoves(self, hashMoveID=-1, orderStage=None):
+        inCheck = self.inCheck()
+        hashMove = self.getHashMove(hashMoveID) if hashMoveID != -1 and not inCheck else None
+        skipID = -1
+        if hashMove is not None:
+            skipID = hashMoveID #don't hand it out a second time in its own stage
+            yield hashMove
+        moves = self.getCaptureMoves() #every evasion when in check
+        if orderStage is not None:
+            orderStage(moves)
+        for move in moves:
+            if move.moveID != skipID:
+                yield move
+        if inCheck: #the evasions were all of them
+            return
+        moves = self.getQuietMoves()
+        if orderStage is not None:
+            orderStage(moves)
+        for move in moves:
+            if move.moveID != skipID and self.isLegalMove(move):
+                yield move
+        moves = []
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        self.getCastleMoves(kingRow, kingCol, moves)
+        for move in moves:
+            if move.moveID != skipID:
+                yield move
+
+    '''
+    Turn a moveID from the transposition table back into a Move if it is legal here. Returns None otherwise,
+    a different position with the same key can leave a move that doesn't fit this board. Only called when not in check
+    '''
+    def getHashMove(self, moveID):
+        (startRow, startCol), (endRow, endCol) = Move.squaresFromID(moveID)
+        piece = self.board[startRow][startCol]
+        if piece[0] != ('w' if self.whiteToMove else 'b'):
+            return None
+        moves = []
+        if piece[1] == 'K' and abs(endCol - startCol) == 2:
+            self.getCastleMoves(startRow, startCol, moves) #castling is legal as generated
+            legal = True
+        else:
+            self.moveFunctions[piece[1]](startRow, startCol, moves) #pseudo-legal, self.pins is None outside getValidMoves
+            legal = False
+        for move in moves:
+            if move.moveID == moveID:
+                return move if legal or self.isLegalMove(move) else None
+        return None
+
+    '''
+    Pseudo-legal moves that capture nothing and don't promote. Castling is left out, getStagedMoves adds it last
+    '''
+    def getQuietMoves(self):
+        return [move for move in self.getAllPossibleMoves() if move.pieceCaptured == "--" and not move.isPawnPromotion]
+
+    '''
+    Check that a pseudo-legal move doesn't leave our own king attacked, by trying it on the board.
+    Only valid when not in check: a piece that isn't on a line with the king can't uncover an attack on it then.
+    En passant always gets tried, the pawn it takes can be the one that uncovers the attack
+    '''
+    def isLegalMove(self, move):
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if move.pieceMoved[1] == 'K':
+            kingRow, kingCol = move.endRow, move.endCol
+        elif not move.isEnpassantMove:
+            dRow = move.startRow - kingRow
+            dCol = move.startCol - kingCol
+            if dRow != 0 and dCol != 0 and dRow != dCol and dRow != -dCol:
+                return True
+        board = self.board
+        capturedRow = move.startRow if move.isEnpassantMove else move.endRow
+        board[move.startRow][move.startCol] = "--"
+        board[capturedRow][move.endCol] = "--"
+        board[move.endRow][move.endCol] = move.pieceMoved
+        attacked = self.squareUnderAttack(kingRow, kingCol)
+        board[move.endRow][move.endCol] = "--" #put everything back
+        board[capturedRow][move.endCol] = move.pieceCaptured
+        board[move.startRow][move.startCol] = move.pieceMoved
+        return not attacked
+
     '''
     Get all the pawn moves for the pawn located at row, col and add these moves to the list
     '''
     def getPawnMoves(self, r, c, moves):
-        if self.whiteToMove: #white pawn moves
-            if self.board[r-1][c] == "--": #check if the square in front of the pawn is empty
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == "--": #check if it is the pawn's first move
-                    moves.append(Move((r, c), (r-2, c), self.board))
-            if c-1 >= 0: #diagonal left capture
-                if self.board[r-1][c-1][0] == 'b': #check if there is an enemy piece to capture
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
-                elif (r-1, c-1) == self.enpassantPossible: #en-passant capture
-                    moves.append(Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
-            if c+1 <= 7: #diagnol right capture
-                if self.board[r-1][c+1][0] == 'b': #check if there is an enemy piece to capture
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
-                elif (r-1, c+1) == self.enpassantPossible: #en-passant capture
-                    moves.append(Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
-        else: #black pawn moves
-            if self.board[r+1][c] == "--":
-                moves.append(Move((r, c), (r+1, c), self.board))
-                if r == 1 and self.board[r+2][c] == "--":
-                    moves.append(Move((r, c), (r+2, c), self.board))
-            if c-1 >= 0: #diagonal left capture
-                if self.board[r+1][c-1][0] == 'w':
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
-                elif (r+1, c-1) == self.enpassantPossible: #en-passant capture
-                    moves.append(Move((r, c), (r+1, c-1), self.board, isEnpassantMove=True))
-            if c+1 <= 7: #diagnol right capture
-                if self.board[r+1][c+1][0] == 'w':
-                    moves.append(Move((r, c), (r+1, c+1), self.board))
-                elif (r+1, c+1) == self.enpassantPossible: #en-passant capture
-                    moves.append(Move((r, c), (r+1, c+1), self.board, isEnpassantMove=True))
+        if self.whiteToMove: #white pawns move up the board
+            moveAmount = -1
+            startRow = 6
+            enemyColor = 'b'
+        else: #black pawns move down the board
+            moveAmount = 1
+            startRow = 1
+            enemyColor = 'w'
+        endRow = r + moveAmount
+        if self.board[endRow][c] == "--" and self.canMoveInDirection(r, c, (moveAmount, 0)): #check if the square in front of the pawn is empty
+            moves.append(Move((r, c), (endRow, c), self.board))
+            if r == startRow and self.board[r + 2*moveAmount][c] == "--": #check if it is the pawn's first move
+                moves.append(Move((r, c), (r + 2*moveAmount, c), self.board))
+        for dc in (-1, 1): #diagonal left and right captures
+            endCol = c + dc
+            if 0 <= endCol <= 7 and self.canMoveInDirection(r, c, (moveAmount, dc)):
+                if self.board[endRow][endCol][0] == enemyColor: #check if there is an enemy piece to capture
+                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                elif (endRow, endCol) == self.enpassantPossible: #en-passant capture
+                    if self.pins is None or self.isEnpassantLegal(r, c, endRow, endCol):
+                        moves.append(Move((r, c), (endRow, endCol), self.board, isEnpassantMove=True))
 
     '''
     Get all the rook moves for the rook located at row, col and add these moves to the list
@@ -243,6 +739,8 @@ class GameState():
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1)) #up, left, down, right
         enemyColor = 'b' if self.whiteToMove else 'w'
         for d in directions:
+            if not self.canMoveInDirection(r, c, d): #pinned pieces can only slide along the pin
+                continue
             for i in range(1, 8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
@@ -262,15 +760,13 @@ class GameState():
     Get all the knight moves for the knight located at row, col and add these moves to the list
     '''
     def getKnightMoves(self, r, c, moves):
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        if self.pins and (r, c) in self.pins: #a pinned knight can never move
+            return
         allyColor = 'w' if self.whiteToMove else 'b'
-        for m in knightMoves:
-            endRow = r + m[0] #m[0] and m[1] represent the row and col changes to reach the next square
-            endCol = c + m[1] 
-            if 0 <= endRow < 8 and 0 <= endCol < 8: #on board
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: #not an ally piece (empty or enemy piece)
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+        for endRow, endCol in KNIGHT_TABLE[r][c]: #only the on board squares
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor: #not an ally piece (empty or enemy piece)
+                moves.append(Move((r, c), (endRow, endCol), self.board))
                 
 
     '''
@@ -280,6 +776,8 @@ class GameState():
         directions = ((-1, -1), (-1, 1), (1, -1), (1, 1)) #up-left, up-right, down-left, down-right
         enemyColor = 'b' if self.whiteToMove else 'w'
         for d in directions:
+            if not self.canMoveInDirection(r, c, d): #pinned pieces can only slide along the pin
+                continue
             for i in range(1, 8): #bishop can move max of 7 squares
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
@@ -307,15 +805,17 @@ class GameState():
     Get all the king moves for the king located at row, col and add these moves to the list
     '''
     def getKingMoves(self, r, c, moves):
-        kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
         allyColor = 'w' if self.whiteToMove else 'b'
-        for i in range(8):
-            endRow = r + kingMoves[i][0]
-            endCol = c + kingMoves[i][1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+        for endRow, endCol in KING_TABLE[r][c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor:
+                if self.pins is not None: #generating legal moves, the king can't step into check
+                    self.board[r][c] = "--" #take the king off its square so it can't hide behind itself along a checking ray
+                    inCheck = self.squareUnderAttack(endRow, endCol)
+                    self.board[r][c] = allyColor + 'K'
+                    if inCheck:
+                        continue
+                moves.append(Move((r, c), (endRow, endCol), self.board))
 
     '''
     Generate all valid castle moves for the king at (r, c) and add them to the list of moves
@@ -323,14 +823,14 @@ class GameState():
     def getCastleMoves(self, r, c, moves):
         if self.squareUnderAttack(r, c):
             return #you can't castle while in check
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
+        if self.castlingRights & (CASTLE_WKS if self.whiteToMove else CASTLE_BKS):
             self.getKingSideCastleMoves(r, c, moves)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
+        if self.castlingRights & (CASTLE_WQS if self.whiteToMove else CASTLE_BQS):
             self.getQueenSideCastleMoves(r, c, moves)
     
     def getKingSideCastleMoves(self, r, c, moves):
         if self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
-            if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
+            if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2): #the king can't pass through or land on an attacked square
                 moves.append(Move((r, c), (r, c+2), self.board, isCastleMove=True))
     
     def getQueenSideCastleMoves(self, r, c, moves):
@@ -338,15 +838,10 @@ class GameState():
             if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
                 moves.append(Move((r, c), (r, c-2), self.board, isCastleMove=True))
 
-class CastleRight():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
-
-
 class Move():
+    #moves are created by the hundred thousand during a search, so they use __slots__ instead of a __dict__ per move
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured",
+                 "isPawnPromotion", "isEnpassantMove", "isCastleMove", "moveID")
     #maps keys to values
     #key : value
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
@@ -357,23 +852,24 @@ class Move():
     colsToFiles = {v: k for k, v in filesToCols.items()} #reversing the dictionary
 
     def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False): #isEnpassantMove and isCastleMove are optional parameters
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
         #pawn promotion
-        self.isPawnPromotion = False
-        self.isPawnPromotion = (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
+        self.isPawnPromotion = (pieceMoved == 'wp' and endRow == 0) or (pieceMoved == 'bp' and endRow == 7)
         #en-passant
         self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
+        if isEnpassantMove:
+            self.pieceCaptured = 'wp' if pieceMoved == 'bp' else 'bp'
+        else:
+            self.pieceCaptured = board[endRow][endCol]
         #castle move
         self.isCastleMove = isCastleMove
-        #update the moveID
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        #the moveID packs the start square (bits 0-5) and end square (bits 6-11), square = row*8 + col.
+        #The squares alone identify a move, the flags follow from the position
+        self.moveID = startRow * 8 + startCol | (endRow * 8 + endCol) << 6
         
     '''
     Overriding the equals method
@@ -383,6 +879,9 @@ class Move():
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
         #you can add to make this more complex
         return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
@@ -390,4 +889,44 @@ class Move():
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
 
-    
\ No newline at end of file
+    '''
+    Standard algebraic notation (SAN) for the move, without the check suffix. validMoves are all the legal moves of the position, for disambiguation
+    '''
+    def getSAN(self, validMoves):
+        if self.isCastleMove:
+            return "O-O" if self.endCol > self.startCol else "O-O-O"
+        destination = self.getRankFile(self.endRow, self.endCol)
+        capture = "x" if self.pieceCaptured != "--" else ""
+        pieceType = self.pieceMoved[1]
+        if pieceType == 'p':
+            san = (self.colsToFiles[self.startCol] + capture if capture else "") + destination
+            return san + "=Q" if self.isPawnPromotion else san #pawns always promote to a queen
+        others = [other for other in validMoves if other.pieceMoved == self.pieceMoved and other.endRow == self.endRow
+                  and other.endCol == self.endCol and other.moveID != self.moveID]
+        origin = ""
+        if others:
+            if all(other.startCol != self.startCol for other in others):
+                origin = self.colsToFiles[self.startCol]
+            elif all(other.startRow != self.startRow for other in others):
+                origin = self.rowsToRanks[self.startRow]
+            else:
+                origin = self.getRankFile(self.startRow, self.startCol)
+        return pieceType + origin + capture + destination
+
+    '''
+    Unpack a moveID into ((startRow, startCol), (endRow, endCol))
+    '''
+    @staticmethod
+    def squaresFromID(moveID):
+        return divmod(moveID & 63, 8), divmod(moveID >> 6, 8)
+
+'''
+Find the move written in SAN (e.g. "Nf3", "exd5", "O-O", "e8=Q+") or coordinate notation (e.g. "g1f3") among validMoves.
+Check marks and annotations are ignored. Returns None if no legal move matches
+'''
+def parseMove(text, validMoves):
+    text = text.rstrip("+#!?").replace("0-0-0", "O-O-O").replace("0-0", "O-O")
+    for move in validMoves:
+        if move.getSAN(validMoves) == text or move.getChessNotation() == text:
+            return move
+    return None
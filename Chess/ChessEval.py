@@ -0,0 +1,107 @@
+#Evaluation tables used by the GameState to keep a running score of the position. Scores are in centipawns, positive is good for white.
+#Every piece gets its material value plus a piece-square bonus, once for the middlegame and once for the endgame. The two are blended by how much material is left.
+
+MATERIAL_MG = {"p": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+MATERIAL_EG = {"p": 120, "N": 300, "B": 320, "R": 520, "Q": 920, "K": 0}
+PHASE_WEIGHTS = {"p": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0, "-": 0} #"-" so the empty square "--" can be looked up too
+MAX_PHASE = 24 #phase of the starting position, 4 minor pieces, 4 rooks and 2 queens
+
+#piece-square tables from white's point of view, laid out like the board: the first row is rank 8
+PAWN_MG = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0]
+PAWN_EG = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     20,  20,  20,  20,  20,  20,  20,  20,
+     10,  10,  10,  10,  10,  10,  10,  10,
+      0,   0,   0,   0,   0,   0,   0,   0,
+      0,   0,   0,   0,   0,   0,   0,   0]
+KNIGHT = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50]
+BISHOP = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20]
+ROOK = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0]
+QUEEN = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20]
+KING_MG = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20]
+KING_EG = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50]
+
+PIECE_SQUARE_MG = {"p": PAWN_MG, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING_MG}
+PIECE_SQUARE_EG = {"p": PAWN_EG, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING_EG}
+
+'''
+Combine material and piece-square values into signed tables indexed as table[piece][row][col].
+Black reads the white table upside down and counts negative
+'''
+def buildScoreTable(material, pieceSquare):
+    table = {"--": [[0] * 8 for r in range(8)]}
+    for pieceType in material:
+        values = pieceSquare[pieceType]
+        table["w" + pieceType] = [[material[pieceType] + values[r*8 + c] for c in range(8)] for r in range(8)]
+        table["b" + pieceType] = [[-(material[pieceType] + values[(7 - r)*8 + c]) for c in range(8)] for r in range(8)]
+    return table
+
+SCORE_MG = buildScoreTable(MATERIAL_MG, PIECE_SQUARE_MG)
+SCORE_EG = buildScoreTable(MATERIAL_EG, PIECE_SQUARE_EG)
+
+'''
+Blend the middlegame and endgame scores by the game phase (MAX_PHASE is the full middlegame, 0 a bare endgame)
+'''
+def taperedScore(mgScore, egScore, phase):
+    if phase > MAX_PHASE: #promotions can push the phase past the starting material
+        phase = MAX_PHASE
+    return (mgScore * phase + egScore * (MAX_PHASE - phase)) // MAX_PHASE
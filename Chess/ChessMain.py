@@ -1,36 +1,118 @@
+import os
+import threading
+import time
 import pygame as p
 import ChessEngine, ChessAI
 WIDTH = HEIGHT = 680 #400 is another option
 DIMENSION = 8  #dimensions of a chess board are 8x8
 SQ_SIZE = HEIGHT // DIMENSION
-MAX_FPS = 15 #for animations later on
-IMAGES = {}
+MAX_FPS = 15 #frame rate while nothing moves
+ANIMATION_FPS = 60 #frame rate while a move is animated
+ANIMATION_TIME = 200 #milliseconds a move animation takes, however far the piece goes
+PONDER = True #let the AI keep searching on the human's time in games against the computer
+SHOW_SEARCH_REPORT = False #show the report of the AI's last search in the top right corner, 'i' switches it on and off
+IMAGES = {} #piece -> sprite scaled to SQ_SIZE, loaded once for the whole process
+PIECES = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
+SPRITE_CACHE = True #keep the scaled sprites in Chess/images/cache as raw pixels, so later starts skip decoding and scaling the PNGs
+SPRITE_CACHE_DIR = "Chess/images/cache"
+FONTS = {} #(name, size, bold, italic) -> pygame font, SysFont searches the system fonts every time it is called
+SCALED_IMAGES = {} #(path, size) -> image loaded from disk and scaled once
+colors = [p.Color("burlywood"), p.Color("burlywood4")] #light and dark squares
+boardSurface = None #the empty board, rendered once
+drawnSquares = {} #(row, col) -> (piece, highlight color) as last drawn on the screen, empty when the whole board has to be drawn again
+overlayRects = [] #text drawn over the board in the last frame, the squares under it are drawn again in the next frame
+AI_MOVE_EVENT = p.USEREVENT + 1 #posted by the AI search thread with the moveID it found
+aiSearchLock = threading.Lock() #ChessAI keeps its search state in module globals, a cancelled search has to finish before the next one starts
+
+click_sound = None #loaded by startAudio, None until then or when there is no audio device
+audioStarted = False
 
-# Initialize the Pygame mixer
-p.mixer.init()
-
-# Load sound effects
-click_sound = p.mixer.Sound("Chess/sounds/capture.mp3")
-
-# Load and play background music
-p.mixer.music.load("Chess/sounds/menu.mp3")
-p.mixer.music.play(-1)  # Loop the music
+'''
+Start only the parts of pygame the window needs. pygame.init() would also open the mixer, which is left to startAudio
+'''
+def initDisplay():
+    p.display.init()
+    p.font.init()
 
-# this class is responsible for storing all the information about the current state of a chess game. It will also be responsible for determining the valid moves at the current state. It will also keep a move log.
+'''
+Open the mixer, load the sound effect and start the menu music on a background thread, so none of it holds up the first frame.
+Where no thread can be started (the WebAssembly build) it is done right here instead, which is after the first frame.
+Only the first call does anything
+'''
+def startAudio():
+    global audioStarted
+    if not audioStarted:
+        audioStarted = True
+        try:
+            threading.Thread(target=loadAudio, daemon=True).start()
+        except RuntimeError: #can't start new thread
+            loadAudio()
+
+def loadAudio():
+    global click_sound
+    try:
+        p.mixer.init()
+        click_sound = p.mixer.Sound("Chess/sounds/capture.mp3")
+        p.mixer.music.load("Chess/sounds/menu.mp3")
+        p.mixer.music.play(-1)  # Loop the music
+    except (p.error, OSError): #no audio device or a missing file, the game just stays quiet
+        pass
+
+def playClick():
+    if click_sound is not None:
+        click_sound.play()
 
 '''
-Initialize a global dictionary of images. This will be called exactly once in the main
+Load the piece sprites into IMAGES. Only the first call does anything, a new game reuses them.
+With SPRITE_CACHE the scaled sprites are read from a raw pixel file for this SQ_SIZE, written the first time
 '''
 def loadImages():
-    pieces = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
-    for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("Chess/images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+    if IMAGES:
+        return
+    paths = ["Chess/images/" + piece + ".png" for piece in PIECES]
+    cachePath = os.path.join(SPRITE_CACHE_DIR, "sprites_%d.rgba" % SQ_SIZE)
+    spriteBytes = SQ_SIZE * SQ_SIZE * 4
+    if SPRITE_CACHE and os.path.exists(cachePath) and os.path.getmtime(cachePath) >= max(os.path.getmtime(path) for path in paths):
+        with open(cachePath, "rb") as f:
+            data = f.read()
+        if len(data) == spriteBytes * len(PIECES):
+            for i, piece in enumerate(PIECES):
+                IMAGES[piece] = p.image.frombytes(data[i*spriteBytes:(i+1)*spriteBytes], (SQ_SIZE, SQ_SIZE), "RGBA").convert_alpha()
+            return
+    for piece, path in zip(PIECES, paths):
+        IMAGES[piece] = p.transform.scale(p.image.load(path), (SQ_SIZE, SQ_SIZE)).convert_alpha()
     # we can access an image by saying 'IMAGES['wp']'
+    if SPRITE_CACHE:
+        try:
+            os.makedirs(SPRITE_CACHE_DIR, exist_ok=True)
+            with open(cachePath, "wb") as f:
+                for piece in PIECES:
+                    f.write(p.image.tobytes(IMAGES[piece], "RGBA"))
+        except OSError: #read-only install, the next start just scales the PNGs again
+            pass
 
 
+'''
+A system font, created the first time it is asked for
+'''
+def getFont(name, size, bold=False, italic=False):
+    key = (name, size, bold, italic)
+    if key not in FONTS:
+        FONTS[key] = p.font.SysFont(name, size, bold, italic)
+    return FONTS[key]
+
+'''
+An image loaded and scaled to size the first time it is asked for
+'''
+def getScaledImage(path, size):
+    key = (path, size)
+    if key not in SCALED_IMAGES:
+        SCALED_IMAGES[key] = p.transform.scale(p.image.load(path), size)
+    return SCALED_IMAGES[key]
+
 # creates a button on the screen
 def create_button(screen, text, rect, hover=False):
-    font = p.font.SysFont("Helvetica", 32)
+    font = getFont("Helvetica", 32)
     color = p.Color("DarkGray") if hover else p.Color("Gray")
     p.draw.rect(screen, color, rect)
     p.draw.rect(screen, p.Color("Black"), rect, 2)  # Border
@@ -48,9 +130,8 @@ def displayDifficultyMenu():
     screen = p.display.set_mode((WIDTH, HEIGHT))
     p.display.set_caption('Select Difficulty')
     
-    # Load the background image
-    background_image = p.image.load("Chess/images/menu.png")
-    background_image = p.transform.scale(background_image, (WIDTH, HEIGHT))
+    background_image = getScaledImage("Chess/images/menu.png", (WIDTH, HEIGHT))
+    clock = p.time.Clock()
     
     button_easy_rect = p.Rect(WIDTH//2 - 150, HEIGHT//3 - 25, 300, 50)
     button_medium_rect = p.Rect(WIDTH//2 - 150, HEIGHT//2 - 25, 300, 50)
@@ -73,31 +154,31 @@ def displayDifficultyMenu():
                 return "quit"
             elif event.type == p.MOUSEBUTTONDOWN:
                 if button_easy_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "easy"
                 elif button_medium_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "medium"
                 elif button_hard_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "hard"
                 elif back_button_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "back"
         
+        clock.tick(MAX_FPS) #the menus only have to follow the mouse, no need to redraw as fast as the CPU allows
         p.display.flip()
 
 
 
 # Display the menu screen
 def displayMenu():
-    p.init()
+    initDisplay()
     screen = p.display.set_mode((WIDTH, HEIGHT))
     p.display.set_caption('Chess Menu')
     
-    # Load the background image
-    background_image = p.image.load("Chess/images/menu.png")
-    background_image = p.transform.scale(background_image, (WIDTH, HEIGHT))
+    background_image = getScaledImage("Chess/images/menu.png", (WIDTH, HEIGHT))
+    clock = p.time.Clock()
     
     button_1v1_computer_rect = p.Rect(WIDTH//2 - 150, HEIGHT//3 - 25, 300, 50)
     button_1v1_human_rect = p.Rect(WIDTH//2 - 150, HEIGHT//2 - 25, 300, 50)
@@ -113,7 +194,7 @@ def displayMenu():
         create_button(screen, "Quit/Exit", button_quit_rect, button_quit_rect.collidepoint(mouse_pos))
         
         # Display "Created by Shafquat" text
-        font = p.font.SysFont("Helvetica", 20)
+        font = getFont("Helvetica", 20)
         created_by_text = font.render("Created by Shafquat", True, p.Color("White"))
         screen.blit(created_by_text, (WIDTH - created_by_text.get_width() - 10, HEIGHT - created_by_text.get_height() - 10))
         
@@ -123,26 +204,27 @@ def displayMenu():
                 return "quit"
             elif event.type == p.MOUSEBUTTONDOWN:
                 if button_1v1_computer_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "computer"
                 elif button_1v1_human_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "human"
                 elif button_quit_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     p.quit()
                     return "quit"
         
+        clock.tick(MAX_FPS)
         p.display.flip()
+        startAudio() #the first frame is on the screen, now the mixer can take its time
 
 # Display the difficulty menu screen
 def displayPauseMenu():
     screen = p.display.set_mode((WIDTH, HEIGHT))
     p.display.set_caption('Pause Menu')
     
-    # Load the background image
-    background_image = p.image.load("Chess/images/menu.png")
-    background_image = p.transform.scale(background_image, (WIDTH, HEIGHT))
+    background_image = getScaledImage("Chess/images/menu.png", (WIDTH, HEIGHT))
+    clock = p.time.Clock()
     
     button_resume_rect = p.Rect(WIDTH//2 - 150, HEIGHT//3 - 25, 300, 50)
     button_main_menu_rect = p.Rect(WIDTH//2 - 150, HEIGHT//2 - 25, 300, 50)
@@ -163,15 +245,16 @@ def displayPauseMenu():
                 return "quit"
             elif event.type == p.MOUSEBUTTONDOWN:
                 if button_resume_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "resume"
                 elif button_main_menu_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "main_menu"
                 elif button_quit_rect.collidepoint(event.pos):
-                    click_sound.play()
+                    playClick()
                     return "quit"
         
+        clock.tick(MAX_FPS)
         p.display.flip()
 
 
@@ -193,12 +276,8 @@ def main():
                     break
                 elif difficulty == "quit":
                     return
-                elif difficulty == "easy":
-                    ChessAI.DEPTH = 1
-                elif difficulty == "medium":
-                    ChessAI.DEPTH = 2
-                elif difficulty == "hard":
-                    ChessAI.DEPTH = 3
+                else:
+                    ChessAI.setDifficulty(difficulty) #time budget per move and depth cap for "easy", "medium" or "hard"
             if choice == "back":
                 continue
             playerOne = True
@@ -207,37 +286,81 @@ def main():
             playerOne = True
             playerTwo = True
 
-        p.init()
+        initDisplay()
         screen = p.display.set_mode((WIDTH, HEIGHT))
         clock = p.time.Clock()
         screen.fill(p.Color("white"))
-        gs = ChessEngine.GameState()
+        invalidateBoard() #the menu was on the screen
+        gs = ChessEngine.newGameState()
         validMoves = gs.getValidMoves()
         moveMade = False #flag variable for when a move is made
         animate = False #flag variable for when we should animate a move
+        animation = None #the MoveAnimation running, the main loop keeps handling events while it plays
         loadImages() #only do this once, before the while loop
         running = True
         sqSelected = () #no square is selected, keep track of the last click of the user (tuple: (row, col))
         playerClicks = [] #keep track of player clicks (two tuples: [(6, 4), (4, 4)])
         gameOver = False #flag variable for when the game is over
+        aiThinking = False #flag variable for when the AI is searching in the background
+        aiStop = None #threading.Event that cancels the running AI search
+        aiSearchID = 0 #number of the latest AI search, moves posted by a cancelled search are ignored
+        ponderStop = None #threading.Event that cancels the search running on the human's time, None when not pondering
+        ponderHit = None #set when the human plays ponderMoveID, the ponder search then becomes the AI's search
+        ponderMoveID = -1 #the move the ponder search expects the human to play, -1 if it is only filling the transposition table
+        searchReport = None #ChessAI search report of the AI's last move
+        showSearchReport = SHOW_SEARCH_REPORT
 
         while running:
             humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
             for e in p.event.get():
                 if e.type == p.QUIT:
                     running = False
+                elif e.type == p.VIDEOEXPOSE: #the window was covered, only a full redraw puts everything back
+                    animation = None
+                    invalidateBoard()
+                elif e.type == AI_MOVE_EVENT:
+                    if aiThinking and e.searchID == aiSearchID: #the search we are waiting for is done, even if it has no move to play
+                        aiThinking = False
+                        aiSearchID += 1 #nothing else this search posts counts
+                        if len(validMoves) > 0:
+                            AIMove = next((move for move in validMoves if move.moveID == e.moveID), None)
+                            if AIMove is None:
+                                AIMove = ChessAI.findRandomMove(validMoves) #if the AI cannot find the best move, then make a random move
+                            searchReport = e.report
+                            gs.makeMove(AIMove)
+                            moveMade = True
+                            animate = True
                 #mouse handler
                 elif e.type == p.MOUSEBUTTONDOWN:
                     if not gameOver and humanTurn:
                         sqSelected, playerClicks, moveMade, animate = handleMouseClick(e, sqSelected, playerClicks, gs, validMoves)
+                        if moveMade and ponderStop is not None:
+                            if gs.moveLog[-1].moveID == ponderMoveID: #the predicted move, the ponder search carries on as the AI's search
+                                ponderHit.set()
+                                aiStop = ponderStop
+                                aiThinking = True
+                            else:
+                                ponderStop.set()
+                            ponderStop = None
                 elif e.type == p.KEYDOWN:
+                    if e.key in (p.K_z, p.K_r, p.K_ESCAPE) and animation is not None: #the board jumps straight to its new state
+                        animation = None
+                        invalidateBoard()
+                    if e.key in (p.K_z, p.K_r, p.K_ESCAPE) and aiThinking: #the position the AI is searching is about to change
+                        aiStop.set()
+                        aiThinking = False
+                    if e.key in (p.K_z, p.K_r, p.K_ESCAPE) and ponderStop is not None:
+                        ponderStop.set()
+                        ponderStop = None
+                    if e.key == p.K_i: #show or hide the search report
+                        showSearchReport = not showSearchReport
                     if e.key == p.K_z: #undo when 'z' is pressed
                         gs.undoMove() #undo the last move
                         moveMade = True
                         animate = False
                         gameOver = False
                     if e.key == p.K_r: #reset the board when 'r' is pressed
-                        gs = ChessEngine.GameState() #reset the game state, instantiate a new game state
+                        gs = ChessEngine.newGameState() #reset the game state, instantiate a new game state
                         validMoves = gs.getValidMoves() #get the valid moves for the new game state
                         sqSelected = () #reset the square selected
                         playerClicks = [] #clear player clicks
@@ -251,73 +374,189 @@ def main():
                         elif pause_choice == "main_menu":
                             running = False  # Exit the game loop to restart main menu
                         elif pause_choice == "resume":
+                            invalidateBoard() #the pause menu covered the board
                             continue  # resume the game
 
-            #AI move finder logic
-            if not gameOver and not humanTurn:
-                AIMove = ChessAI.findBestMove(gs, validMoves)
-                if AIMove is None: 
-                    AIMove = ChessAI.findRandomMove(validMoves) #if the AI cannot find the best move, then make a random move 
-                gs.makeMove(AIMove)
-                moveMade = True
-                animate = True
+            humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo) #undo or reset may have changed the turn
+            #AI move finder logic, the search runs on its own thread and posts its move back as an AI_MOVE_EVENT
+            if running and not gameOver and not humanTurn and not aiThinking and not moveMade:
+                aiSearchID += 1
+                aiStop = startAISearch(gs, aiSearchID)
+                aiThinking = True
+            #think on the human's time, about the move the AI expects or else about the whole position
+            if PONDER and running and not gameOver and humanTurn and not (playerOne and playerTwo) and ponderStop is None and not moveMade:
+                aiSearchID += 1
+                ponderStop, ponderHit, ponderMoveID = startPonderSearch(gs, aiSearchID)
 
             if moveMade:
-                click_sound.play()
+                playClick()
                 if animate:
-                    animateMove(gs.moveLog[-1], screen, gs.board, clock) #animate the last move made
+                    animation = MoveAnimation(gs.moveLog[-1], gs.board) #animate the last move made, replacing an animation still running
+                elif animation is not None:
+                    animation = None
+                    invalidateBoard()
                 validMoves = gs.getValidMoves()
                 moveMade = False
                 animate = False
 
-            drawGameState(screen, gs, validMoves, sqSelected)
-
-            if gs.checkMate or gs.staleMate: 
+            if gs.checkMate or gs.staleMate or gs.isDrawByRule():
                 gameOver = True #the game is over
-                text = 'Stalemate' if gs.staleMate else 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate' #if the game is over, then display the appropriate text
-                drawText(screen, text) 
+            if animation is not None:
+                dirtyRects = animation.draw(screen)
+                if animation.finished:
+                    animation = None
+                    invalidateBoard() #the animation drew over the board
+                clock.tick(ANIMATION_FPS)
+                p.display.update(dirtyRects)
+                continue
+
+            dirtyRects = drawGameState(screen, gs, validMoves, sqSelected) #only the squares that changed since the last frame
+
+            if gameOver:
+                text = gameOverText(gs)
+                dirtyRects.append(drawText(screen, text))
+            elif aiThinking:
+                dirtyRects.append(drawThinking(screen))
+            if showSearchReport and searchReport is not None:
+                dirtyRects.append(drawSearchReport(screen, searchReport))
             clock.tick(MAX_FPS)
-            p.display.flip()
+            p.display.update(dirtyRects)
+        if aiThinking: #leaving the game, don't let the search keep running
+            aiStop.set()
+        if ponderStop is not None:
+            ponderStop.set()
 
 
 
 '''
-Highlight square selected and moves for piece selected
+Start the AI search on a background thread. The thread searches a copy of the position set up from its FEN, so the live gs
+is never touched while the player undoes, resets or pauses. Returns the threading.Event that cancels the search
+'''
+def startAISearch(gs, searchID):
+    searchState = ChessEngine.newGameState()
+    searchState.loadFEN(gs.getFEN())
+    searchState.setRepetitionHistory(gs.getRepetitionHistory()) #so the AI sees the repetitions the game has had
+    stop = threading.Event()
+    thread = threading.Thread(target=runAISearch, args=(searchState, stop, searchID), daemon=True)
+    thread.start()
+    return stop
+
+'''
+Body of the AI search thread. The move goes back to the main loop as a moveID in an AI_MOVE_EVENT
+'''
+def runAISearch(gs, stop, searchID, ponderHit=None):
+    with aiSearchLock:
+        if stop.is_set():
+            return
+        AIMove, report = ChessAI.findBestMove(gs, gs.getValidMoves(), stop=stop, ponderHit=ponderHit, report=True)
+    if searchID is None: #pondering without a predicted move only fills the transposition table
+        return
+    while ponderHit is not None and not ponderHit.wait(0.05): #a ponder search that finished early holds its move until the prediction comes true
+        if stop.is_set():
+            return
+    if not stop.is_set():
+        p.event.post(p.event.Event(AI_MOVE_EVENT, moveID=AIMove.moveID if AIMove is not None else -1, searchID=searchID, report=report))
+
 '''
-def highlightSquares(screen, gs, validMoves, sqSelected):
+Start pondering on the human's turn. The AI guesses the human's move from its transposition table and searches the position
+after it on a background thread, with the clock stopped until ponderHit is set. If it has no guess it searches the human's position
+instead, which fills the transposition table for every reply. Returns (stop, ponderHit, predicted moveID or -1)
+'''
+def startPonderSearch(gs, searchID):
+    searchState = ChessEngine.newGameState()
+    searchState.loadFEN(gs.getFEN())
+    searchState.setRepetitionHistory(gs.getRepetitionHistory()) #so the AI sees the repetitions the game has had
+    predictedMove = ChessAI.predictMove(searchState, searchState.getValidMoves())
+    if predictedMove is not None:
+        searchState.makeMove(predictedMove)
+        predictedMoveID = predictedMove.moveID
+    else:
+        predictedMoveID = -1
+        searchID = None
+    stop = threading.Event()
+    ponderHit = threading.Event()
+    thread = threading.Thread(target=runAISearch, args=(searchState, stop, searchID, ponderHit), daemon=True)
+    thread.start()
+    return stop, ponderHit, predictedMoveID
+
+'''
+Squares to highlight for the square selected and the moves of the piece on it, as {(row, col): color name}
+'''
+def highlightSquares(gs, validMoves, sqSelected):
+    highlights = {}
     if sqSelected != ():
         r, c = sqSelected
-        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'): #sqSelected is a piece that can be moved, this is a nested loop
-            #highlight selected square
-            s = p.Surface((SQ_SIZE, SQ_SIZE)) #the square that will be highlighted
-            s.set_alpha(100) #transparency value -> 0 transparent; 255 opaque
-            s.fill(p.Color('purple4')) # color the square red
-            screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE)) # draw the square for the selected piece
-            #highlight moves from that square
-            s.fill(p.Color('plum')) # color the square orange
+        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'): #sqSelected is a piece that can be moved
+            highlights[(r, c)] = 'purple4' #the square of the selected piece
             for move in validMoves:
                 if move.startRow == r and move.startCol == c: #the move is from the selected square
-                    screen.blit(s, (move.endCol*SQ_SIZE, move.endRow*SQ_SIZE)) # draw the square for the valid move
+                    highlights[(move.endRow, move.endCol)] = 'plum'
+    return highlights
 
 '''
-Responsible for all the graphics within a current game state.
+Responsible for all the graphics within a current game state. Only the squares whose piece or highlight changed since the
+last frame, or that had text drawn over them, are drawn again. Returns the rects that changed, for p.display.update
 '''
 def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen) #draw squares on the board
-    highlightSquares(screen, gs, validMoves, sqSelected) #highlight square selected and moves for piece
-    drawPieces(screen, gs.board) #draw pieces on top of those squares
+    highlights = highlightSquares(gs, validMoves, sqSelected)
+    covered = set() #squares under last frame's text
+    for rect in overlayRects:
+        for r in range(max(rect.top // SQ_SIZE, 0), min((rect.bottom - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+            for c in range(max(rect.left // SQ_SIZE, 0), min((rect.right - 1) // SQ_SIZE, DIMENSION - 1) + 1):
+                covered.add((r, c))
+    overlayRects.clear()
+    fullRedraw = not drawnSquares
+    dirtyRects = []
+    for r in range(DIMENSION):
+        for c in range(DIMENSION):
+            state = (gs.board[r][c], highlights.get((r, c)))
+            if fullRedraw or drawnSquares.get((r, c)) != state or (r, c) in covered:
+                drawSquare(screen, r, c, state[0], state[1])
+                drawnSquares[(r, c)] = state
+                dirtyRects.append(p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    if fullRedraw:
+        return [p.Rect(0, 0, WIDTH, HEIGHT)]
+    return dirtyRects
 
 '''
-Draw the squares on the board. The top left square is always light
+Forget what is on the screen, so the next drawGameState draws the whole board. Needed after anything else drew over it
 '''
+def invalidateBoard():
+    drawnSquares.clear()
+    overlayRects.clear()
 
-def drawBoard(screen):
-    global colors
-    colors = [p.Color("burlywood"), p.Color("burlywood4")]
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            color = colors[((r+c) % 2)]
-            p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+'''
+Draw one square: the empty square from the board surface, its highlight and its piece
+'''
+def drawSquare(screen, r, c, piece, highlight):
+    square = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    screen.blit(getBoardSurface(), square, square)
+    if highlight is not None:
+        screen.blit(getHighlightSurface(highlight), square)
+    if piece != "--":
+        screen.blit(IMAGES[piece], square)
+
+'''
+The empty board, rendered the first time it is needed. The top left square is always light
+'''
+def getBoardSurface():
+    global boardSurface
+    if boardSurface is None:
+        boardSurface = p.Surface((DIMENSION*SQ_SIZE, DIMENSION*SQ_SIZE))
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                p.draw.rect(boardSurface, colors[(r+c) % 2], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    return boardSurface
+
+highlightSurfaces = {} #color name -> translucent square
+
+def getHighlightSurface(color):
+    if color not in highlightSurfaces:
+        s = p.Surface((SQ_SIZE, SQ_SIZE))
+        s.set_alpha(100) #transparency value -> 0 transparent; 255 opaque
+        s.fill(p.Color(color))
+        highlightSurfaces[color] = s
+    return highlightSurfaces[color]
 
 '''
 Draw the pieces on the board using the current GameState.board
@@ -330,44 +569,117 @@ def drawPieces(screen, board):
                 screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
 '''
-Animating a move
-'''
-def animateMove(move, screen, board, clock):
-    global colors
-    dR = move.endRow - move.startRow #change in row, delta row
-    dC = move.endCol - move.startCol #change in column, delta column
-    framesPerSquare = 10 #frames to move one square
-    frameCount = (abs(dR) + abs(dC)) * framesPerSquare #total number of frames for a move
-    for frame in range(frameCount + 1): # +1 to ensure the last frame is the end square
-        r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount) #calculate the current row and column for the piece
-        drawBoard(screen) #draw squares on the board for each frame
-        drawPieces(screen, board) #draw pieces on top of those squares for each frame
-        #erase the piece from its ending square
-        color = colors[(move.endRow + move.endCol) % 2] #color of the square
-        endSquare = p.Rect(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE, SQ_SIZE, SQ_SIZE) #rectangle for the end square
-        p.draw.rect(screen, color, endSquare) #draw a rectangle on the end square
-        #draw captured piece onto rectangle
+Animating a move. The board behind the moving piece is put together once, then every frame only puts the background back where
+the piece was and draws it where it is now. The piece takes ANIMATION_TIME to arrive, however far it goes
+'''
+class MoveAnimation():
+    def __init__(self, move, board):
+        self.move = move
+        self.sprite = IMAGES[move.pieceMoved]
+        self.startTime = time.perf_counter()
+        self.lastRect = None #where the piece was drawn in the last frame, None before the first frame
+        self.finished = False
+        #the board after the move, without the piece that moved and with the piece it captured
+        self.background = getBoardSurface().copy()
+        drawPieces(self.background, board)
+        endSquare = p.Rect(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        self.background.blit(getBoardSurface(), endSquare, endSquare) #erase the piece from its ending square
         if move.pieceCaptured != '--':
-            if move.isEnpassantMove: #if it is an en passant move
-                enPassantRow = (move.endRow + 1) if move.pieceCaptured[0] == 'b' else move.endRow - 1 #if it is an en passant move, then the captured piece is not on the end square, but on the square behind the pawn
-                endSquare = p.Rect(move.endCol*SQ_SIZE, enPassantRow*SQ_SIZE, SQ_SIZE, SQ_SIZE) 
-            screen.blit(IMAGES[move.pieceCaptured], endSquare) 
-        #draw moving piece
-        if move.pieceMoved != '--':
-            screen.blit(IMAGES[move.pieceMoved], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))  
-        p.display.flip() #update the screen for each frame
-        clock.tick(60) #speed of the animation, 60 frames per second
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow #the en passant victim sits beside the pawn's start square
+            self.background.blit(IMAGES[move.pieceCaptured], p.Rect(move.endCol*SQ_SIZE, captureRow*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+
+    '''
+    Draw the next frame. Returns the rects that changed, for p.display.update
+    '''
+    def draw(self, screen):
+        if self.lastRect is None:
+            screen.blit(self.background, (0, 0))
+            dirtyRects = [p.Rect(0, 0, WIDTH, HEIGHT)]
+        else:
+            screen.blit(self.background, self.lastRect, self.lastRect) #put back what was under the piece
+            dirtyRects = [self.lastRect]
+        progress = min(1.0, (time.perf_counter() - self.startTime) * 1000 / ANIMATION_TIME) #not p.time.get_ticks, that stays 0 without pygame.init()
+        move = self.move
+        x = (move.startCol + (move.endCol - move.startCol) * progress) * SQ_SIZE
+        y = (move.startRow + (move.endRow - move.startRow) * progress) * SQ_SIZE
+        rect = p.Rect(round(x), round(y), SQ_SIZE, SQ_SIZE)
+        screen.blit(self.sprite, rect)
+        dirtyRects.append(rect)
+        self.lastRect = rect
+        self.finished = progress >= 1.0
+        return dirtyRects
+
+'''
+What to show when the game is over. A checkmate counts even when it comes on the fiftieth move or repeats a position
+'''
+def gameOverText(gs):
+    if gs.checkMate:
+        return 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate'
+    if gs.staleMate:
+        return 'Stalemate'
+    if gs.repetitionCount() >= ChessEngine.REPETITION_DRAW:
+        return 'Draw by threefold repetition'
+    return 'Draw by the fifty-move rule'
 
 '''
-Draw the text on the screen
+Draw the text on the screen. Returns the rect it covers
 '''
 def drawText(screen, text):
-    font = p.font.SysFont('Helvitca', 32, True, False)
+    font = getFont('Helvitca', 32, True, False)
     textObject = font.render(text, 0, p.Color('Gray'))
-    textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2) #center the text
+    textLocation = textObject.get_rect(center=(WIDTH//2, HEIGHT//2)) #center the text
     screen.blit(textObject, textLocation)
     textObject = font.render(text, 0, p.Color('Black'))
     screen.blit(textObject, textLocation.move(2, 2))
+    rect = textLocation.union(textLocation.move(2, 2))
+    overlayRects.append(rect)
+    return rect
+
+
+'''
+Show that the AI is searching, in the bottom left corner with the dots counting up. Returns the rect it covers
+'''
+def drawThinking(screen):
+    font = getFont('Helvitca', 24, True, False)
+    dots = "." * (int(time.perf_counter() / 0.4) % 4)
+    textObject = font.render("Thinking" + dots, True, p.Color('Black'))
+    background = p.Surface((textObject.get_width() + 12, textObject.get_height() + 8))
+    background.set_alpha(160)
+    background.fill(p.Color('White'))
+    screen.blit(background, (6, HEIGHT - background.get_height() - 6))
+    screen.blit(textObject, (12, HEIGHT - background.get_height() - 2))
+    rect = background.get_rect(topleft=(6, HEIGHT - background.get_height() - 6))
+    overlayRects.append(rect)
+    return rect
+
+'''
+Show the ChessAI search report of the AI's last move in the top right corner. Returns the rect it covers
+'''
+def drawSearchReport(screen, report):
+    font = getFont('Helvitca', 20, False, False)
+    def percent(rate):
+        return "-" if rate is None else "%.0f%%" % (rate * 100)
+    lines = ["%s %s, depth %d, score %s" % (report["source"], report["move"], report["depth"], "-" if report["score"] is None else "%+.2f" % (report["score"] / 100)),
+             "%d nodes (%d quiescence), %s nodes/s" % (report["nodes"], report["quiescenceNodes"], report["nps"] if report["nps"] is not None else "-"),
+             "cutoffs %s, first move %s, ebf %s" % (percent(report["cutoffRate"]), percent(report["firstMoveCutoffRate"]), "-" if report["ebf"] is None else "%.1f" % report["ebf"]),
+             "tt hits %s, tablebase hits %d, %.2fs" % (percent(report["ttHitRate"]), report["tablebaseHits"], report["seconds"]),
+             "pv " + " ".join(report["pv"])]
+    if report["moveGenSeconds"] is not None:
+        lines.append("move generation %.2fs, evaluation %.2fs" % (report["moveGenSeconds"], report["evalSeconds"]))
+    textObjects = [font.render(line, True, p.Color('Black')) for line in lines]
+    width = max(textObject.get_width() for textObject in textObjects) + 12
+    height = sum(textObject.get_height() for textObject in textObjects) + 8
+    background = p.Surface((width, height))
+    background.set_alpha(180)
+    background.fill(p.Color('White'))
+    rect = background.get_rect(topright=(WIDTH - 6, 6))
+    screen.blit(background, rect)
+    y = rect.top + 4
+    for textObject in textObjects:
+        screen.blit(textObject, (rect.left + 6, y))
+        y += textObject.get_height()
+    overlayRects.append(rect)
+    return rect
 
 
 '''
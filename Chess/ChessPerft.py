@@ -0,0 +1,155 @@
+#Perft (performance test) for the move generator. Counts the leaf nodes of the legal move tree down to a fixed depth
+#and compares them with known counts, so any move generation bug shows up as a wrong number. Also reports nodes per second.
+#
+#   python Chess/ChessPerft.py                          run the reference suite on the default backend
+#   python Chess/ChessPerft.py --backend bitboard       run it on the bitboard backend
+#   python Chess/ChessPerft.py --fen "<FEN>" --depth 3 --divide    leaf counts per root move for one position
+#   python Chess/ChessPerft.py --record-baseline        save the measured nodes/sec as the baseline for later runs
+#
+#The baseline file (perft_baseline.json) is machine-local and ignored by git. Without one the speed check is skipped with a warning.
+import argparse
+import json
+import os
+import sys
+import time
+import ChessEngine
+
+#(name, FEN, leaf counts for depth 1, 2, 3...)
+#ChessEngine only promotes to a queen. Where a pawn promotes inside the tree the counts are lower than the published
+#ones (which count all four promotion pieces). Those counts were cross-checked between the mailbox and bitboard backends
+POSITIONS = [
+    ("initial", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4074224]), #published depth 4: 4085603
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 228, 8087, 320802]), #published: 6, 264, 9467, 422333
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [41, 1373, 54007]), #published: 44, 1486, 62379
+    ("illegal en passant 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", [18, 92, 1670, 10138, 185429, 1132035]), #published depth 6: 1134888
+    ("illegal en passant 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", [13, 102, 1266, 10276, 135655, 1013750]), #published depth 6: 1015133
+    ("en passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", [15, 126, 1928, 13931, 206136, 1438912]), #published depth 6: 1440467
+    ("short castle gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", [15, 66, 1198, 6399, 120330, 661072]),
+    ("long castle gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", [16, 71, 1286, 7418, 141077, 803711]),
+    ("castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", [26, 1141, 27826, 1274206]),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", [44, 1494, 50509, 1720476]),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", [5, 75, 694, 9674, 128641, 1783549]), #published depth 6: 3821001
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", [29, 165, 5160, 30674, 963213]), #published depth 5: 1004658
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", [2, 6, 13, 63, 331, 1924]), #published depth 6: 2217
+    ("stalemate and checkmate 1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", [7, 19, 129, 498, 4217, 18519, 188160]), #published depth 7: 567584
+    ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", [37, 183, 6559, 23527]),
+]
+MAX_NODES = 250000 #the suite searches each position to the deepest depth whose count is at most this
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perft_baseline.json")
+BASELINE_TOLERANCE = 0.8 #fail when nodes/sec drops below this fraction of the recorded baseline
+
+'''
+Count the leaf nodes of the legal move tree depth plies deep
+'''
+def perft(gs, depth):
+    moves = gs.getValidMoves()
+    if depth == 1: #no need to make the last moves, just count them
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+'''
+Leaf counts split by root move, as a list of (move in coordinate notation, count). Compare with another engine to find the bad move
+'''
+def divide(gs, depth):
+    counts = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts.append((move.getChessNotation(), perft(gs, depth - 1) if depth > 1 else 1))
+        gs.undoMove()
+    return counts
+
+'''
+Create a GameState of the given backend set up from fen
+'''
+def newPosition(backend, fen):
+    ChessEngine.BACKEND = backend
+    gs = ChessEngine.newGameState()
+    gs.loadFEN(fen)
+    return gs
+
+'''
+Run the reference positions. Returns a list of (name, depth, nodes, expected nodes, seconds)
+'''
+def runSuite(backend, maxNodes=MAX_NODES, maxDepth=None):
+    results = []
+    for name, fen, counts in POSITIONS:
+        depth = 1
+        while depth < len(counts) and counts[depth] <= maxNodes and (maxDepth is None or depth < maxDepth):
+            depth += 1
+        gs = newPosition(backend, fen)
+        start = time.perf_counter()
+        nodes = perft(gs, depth)
+        results.append((name, depth, nodes, counts[depth - 1], time.perf_counter() - start))
+    return results
+
+def loadBaseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft correctness and speed test for the ChessEngine move generator.")
+    parser.add_argument("--backend", default=ChessEngine.BACKEND, choices=["mailbox", "bitboard"])
+    parser.add_argument("--fen", help="count this position instead of running the reference suite")
+    parser.add_argument("--depth", type=int, help="perft depth for --fen, or the deepest depth for the suite")
+    parser.add_argument("--divide", action="store_true", help="with --fen, print the count for every root move")
+    parser.add_argument("--max-nodes", type=int, default=MAX_NODES, help="suite: deepest depth whose known count is at most this")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON file with the nodes/sec baseline per backend")
+    parser.add_argument("--record-baseline", action="store_true", help="save this run's nodes/sec as the new baseline")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        depth = args.depth or 3
+        gs = newPosition(args.backend, args.fen)
+        start = time.perf_counter()
+        if args.divide:
+            counts = divide(gs, depth)
+            for notation, count in sorted(counts):
+                print(notation + ": " + str(count))
+            nodes = sum(count for notation, count in counts)
+        else:
+            nodes = perft(gs, depth)
+        seconds = time.perf_counter() - start
+        print("depth %d: %d nodes in %.2fs (%.0f nodes/sec)" % (depth, nodes, seconds, nodes / max(seconds, 1e-9)))
+        return 0
+
+    failed = False
+    totalNodes = 0
+    totalSeconds = 0.0
+    for name, depth, nodes, expected, seconds in runSuite(args.backend, args.max_nodes, args.depth):
+        ok = nodes == expected
+        failed = failed or not ok
+        totalNodes += nodes
+        totalSeconds += seconds
+        print("%-28s depth %d  %9d nodes  %7.2fs  %s" % (name, depth, nodes, seconds, "ok" if ok else "FAIL, expected %d" % expected))
+    nodesPerSecond = totalNodes / max(totalSeconds, 1e-9)
+    print("%s backend: %d nodes in %.2fs, %.0f nodes/sec" % (args.backend, totalNodes, totalSeconds, nodesPerSecond))
+
+    baseline = loadBaseline(args.baseline)
+    if args.record_baseline:
+        baseline[args.backend] = round(nodesPerSecond)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("recorded baseline of %.0f nodes/sec in %s" % (nodesPerSecond, args.baseline))
+    elif args.backend in baseline:
+        floor = baseline[args.backend] * BASELINE_TOLERANCE
+        if nodesPerSecond < floor:
+            print("FAIL: %.0f nodes/sec is below %.0f%% of the %d nodes/sec baseline" % (nodesPerSecond, BASELINE_TOLERANCE * 100, baseline[args.backend]))
+            failed = True
+    else: #nodes/sec depends on the machine, so the baseline is recorded locally and not committed
+        print("WARNING: no %s baseline in %s, the speed check did not run. Record one on this machine with --record-baseline"
+              % (args.backend, args.baseline))
+    if failed:
+        print("perft FAILED")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
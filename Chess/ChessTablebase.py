@@ -0,0 +1,350 @@
+#Endgame tablebases for positions with at most 4 pieces, kings included. Every table holds the exact result of every position
+#of one material balance (e.g. "KQvK", "KRvKB") with distance to mate, worked out by retrograde analysis: start from the mates,
+#then walk the engine's moves backwards one ply at a time. Positions with castling rights or an en passant square are not covered.
+#
+#   python Chess/ChessTablebase.py                 generate every 3-piece table (takes a few minutes)
+#   python Chess/ChessTablebase.py KQvKR KRvKB     generate these tables and the smaller ones they lead to (a 4-piece table takes about an hour)
+#
+#A table is a file of one byte per position, indexed by the side to move and the square of every piece:
+#0 is a draw (or an impossible position), 1-127 a win for the side to move, mate in that many moves,
+#128 + n a loss for the side to move, getting mated in n moves. The files are memory-mapped when probed.
+#Like the rest of ChessEngine, pawns only promote to a queen.
+import mmap
+import os
+import sys
+import time
+from array import array
+import ChessEngine
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+MAX_PIECES = 4
+PIECE_ORDER = "KQRBNp" #order of the pieces in a table name, and of their squares in the index
+PIECE_VALUES = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+THREE_PIECE_TABLES = ["KQvK", "KRvK", "KBvK", "KNvK", "KPvK"]
+WIN, DRAW, LOSS = 1, 0, -1
+
+'''
+Table name for the piece types of each side, e.g. (["K", "Q"], ["K"]) -> "KQvK". Pawns are written as P
+'''
+def tableName(whiteTypes, blackTypes):
+    def sideName(types):
+        return "".join(sorted(types, key=PIECE_ORDER.index)).replace("p", "P")
+    return sideName(whiteTypes) + "v" + sideName(blackTypes)
+
+'''
+The piece codes of a table in index order, e.g. "KQvK" -> ["wK", "wQ", "bK"]
+'''
+def tablePieces(name):
+    white, black = name.split("v")
+    return ['w' + t.replace("P", "p") for t in white] + ['b' + t.replace("P", "p") for t in black]
+
+'''
+Tables are only kept with the stronger side as white. True if this material has to be looked up with the colors swapped
+'''
+def isFlipped(whiteTypes, blackTypes):
+    def strength(types):
+        return (len(types), sum(PIECE_VALUES[t] for t in types), tableName(types, [])) #the name breaks ties so only one side is "stronger"
+    return strength(whiteTypes) < strength(blackTypes)
+
+def encodeResult(result, plies):
+    if result == WIN:
+        return (plies + 1) // 2
+    if result == LOSS:
+        return 128 + plies // 2
+    return 0
+
+'''
+(result, plies to mate) for a stored byte, result from the side to move's point of view
+'''
+def decodeResult(value):
+    if value == 0:
+        return DRAW, 0
+    if value < 128:
+        return WIN, value * 2 - 1
+    return LOSS, (value - 128) * 2
+
+def tableIndex(whiteToMove, squares):
+    index = 0 if whiteToMove else 1
+    for sq in squares:
+        index = index * 64 + sq
+    return index
+
+openTables = {} #name -> mmap of the table file, or None if there is no such file
+
+'''
+The table with this name, memory-mapped the first time it is asked for. None if it hasn't been generated
+'''
+def getTable(name):
+    if name not in openTables:
+        path = os.path.join(TABLEBASE_DIR, name + ".bin")
+        table = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) #the mapping stays valid after the file is closed
+            if len(table) != 2 * 64 ** len(tablePieces(name)):
+                raise ValueError("tablebase " + path + " has the wrong size")
+        openTables[name] = table
+    return openTables[name]
+
+'''
+Look up a position given as a list of (piece, square index row*8 + col). Returns (result, plies to mate) for the side to move,
+or None if there is no table for this material
+'''
+def probePieces(pieces, whiteToMove):
+    whiteTypes = [piece[1] for piece, sq in pieces if piece[0] == 'w']
+    blackTypes = [piece[1] for piece, sq in pieces if piece[0] == 'b']
+    if len(pieces) == 2:
+        return DRAW, 0 #two bare kings
+    if isFlipped(whiteTypes, blackTypes): #mirror the board top to bottom and swap the colors
+        pieces = [(('b' if piece[0] == 'w' else 'w') + piece[1], (7 - sq // 8) * 8 + sq % 8) for piece, sq in pieces]
+        whiteToMove = not whiteToMove
+        whiteTypes, blackTypes = blackTypes, whiteTypes
+    name = tableName(whiteTypes, blackTypes)
+    table = getTable(name)
+    if table is None:
+        return None
+    remaining = list(pieces)
+    squares = []
+    for piece in tablePieces(name):
+        for i in range(len(remaining)):
+            if remaining[i][0] == piece:
+                squares.append(remaining.pop(i)[1])
+                break
+    return decodeResult(table[tableIndex(whiteToMove, squares)])
+
+'''
+Look up the position of a GameState. Returns (result, plies to mate) for the side to move, or None if no table covers it
+'''
+def probe(gs):
+    if gs.pieceCount > MAX_PIECES or gs.enpassantPossible != () or gs.castlingRights:
+        return None
+    pieces = []
+    for r in range(8):
+        for c in range(8):
+            if gs.board[r][c] != "--":
+                pieces.append((gs.board[r][c], r * 8 + c))
+    return probePieces(pieces, gs.whiteToMove)
+
+'''
+The tablebase move for a covered position: the fastest win, else a drawing move, else the slowest loss. None if no table covers it
+'''
+def getTablebaseMove(gs, validMoves):
+    if probe(gs) is None:
+        return None
+    bestMove = None
+    bestRank = None
+    for move in validMoves:
+        gs.makeMove(move)
+        result = probe(gs)
+        gs.undoMove()
+        if result is None: #can't happen once the position itself is covered, unless a smaller table is missing
+            return None
+        outcome, plies = result
+        if outcome == LOSS: #the opponent loses, so we win
+            rank = (2, -plies)
+        elif outcome == DRAW:
+            rank = (1, 0)
+        else:
+            rank = (0, plies)
+        if bestRank is None or rank > bestRank:
+            bestMove, bestRank = move, rank
+    return bestMove
+
+'''
+Set up the board of gs with the pieces on the given squares and nothing else
+'''
+def placePieces(gs, pieces, squares, whiteToMove):
+    for piece, sq in zip(pieces, squares):
+        gs.board[sq // 8][sq % 8] = piece
+        if piece == 'wK':
+            gs.whiteKingLocation = (sq // 8, sq % 8)
+        elif piece == 'bK':
+            gs.blackKingLocation = (sq // 8, sq % 8)
+    gs.whiteToMove = whiteToMove
+
+def clearPieces(gs, squares):
+    for sq in squares:
+        gs.board[sq // 8][sq % 8] = "--"
+
+'''
+Squares a piece of the side that just moved could have come from to reach sq, without capturing. For everything but pawns
+these are just the squares it could move to from sq, found with the engine's own move generation
+'''
+def unmoveSquares(gs, piece, sq):
+    r, c = sq // 8, sq % 8
+    if piece[1] != 'p':
+        gs.whiteToMove = piece[0] == 'w'
+        moves = []
+        gs.moveFunctions[piece[1]](r, c, moves) #pseudo-legal, gs.pins is None
+        return [move.endRow * 8 + move.endCol for move in moves if move.pieceCaptured == "--"]
+    back = 1 if piece[0] == 'w' else -1 #white pawns move up the board, so they came from the row below
+    origins = []
+    if 1 <= r + back <= 6 and gs.board[r + back][c] == "--":
+        origins.append((r + back) * 8 + c)
+        if r == (4 if piece[0] == 'w' else 3) and gs.board[r + 2 * back][c] == "--": #a double step from the starting row
+            origins.append((r + 2 * back) * 8 + c)
+    return origins
+
+'''
+Work out one table by retrograde analysis and write it to TABLEBASE_DIR. Every table a capture or promotion leads to has to exist already
+'''
+def generateTable(name, log=print):
+    pieces = tablePieces(name)
+    count = len(pieces)
+    size = 2 * 64 ** count
+    start = time.perf_counter()
+    values = bytearray(size) #encoded results
+    status = bytearray(size) #0 not known yet, 1 known, 2 impossible position
+    movesLeft = bytearray(size) #moves of a position whose result isn't known yet, a position is lost once they all are wins for the opponent
+    resolved = {} #plies -> array of positions whose result is mate in that many plies
+    exits = {} #plies -> array of positions with a capture or promotion into a smaller table that is mate in that many plies
+    gs = ChessEngine.GameState()
+    gs.board = [["--"] * 8 for r in range(8)]
+    gs.castlingRights = 0
+    gs.enpassantPossible = ()
+
+    #first pass, find the impossible positions, the mates and the moves that leave the table
+    for index in range(size):
+        squares = []
+        rest = index
+        for i in range(count):
+            rest, sq = divmod(rest, 64)
+            squares.append(sq)
+        squares.reverse()
+        whiteToMove = rest == 0
+        if len(set(squares)) != count or any(piece[1] == 'p' and sq // 8 in (0, 7) for piece, sq in zip(pieces, squares)):
+            status[index] = 2
+            continue
+        placePieces(gs, pieces, squares, not whiteToMove)
+        kingRow, kingCol = gs.blackKingLocation if whiteToMove else gs.whiteKingLocation
+        if gs.squareUnderAttack(kingRow, kingCol): #the side to move could take the king
+            status[index] = 2
+            clearPieces(gs, squares)
+            continue
+        gs.whiteToMove = whiteToMove
+        moves = gs.getValidMoves()
+        if len(moves) == 0:
+            status[index] = 1
+            if gs.inCheck():
+                values[index] = encodeResult(LOSS, 0)
+                resolved.setdefault(0, array('L')).append(index)
+        else:
+            movesLeft[index] = len(moves)
+            for move in moves:
+                if move.pieceCaptured == "--" and not move.isPawnPromotion:
+                    continue
+                after = []
+                for piece, sq in zip(pieces, squares):
+                    if sq == move.startRow * 8 + move.startCol:
+                        after.append((piece[0] + 'Q' if move.isPawnPromotion else piece, move.endRow * 8 + move.endCol))
+                    elif sq != move.endRow * 8 + move.endCol: #the captured piece leaves the board
+                        after.append((piece, sq))
+                result = probePieces(after, not whiteToMove)
+                if result is None:
+                    raise ValueError("generate the tablebase for " + tableName([p[1] for p, s in after if p[0] == 'w'], [p[1] for p, s in after if p[0] == 'b']) + " before " + name)
+                if result[0] != DRAW:
+                    exits.setdefault(result[1], array('L')).append(index)
+        clearPieces(gs, squares)
+
+    #then go backwards from the positions found at each distance. A position with a move into a lost position is won one ply later,
+    #a position whose moves all lead to won positions is lost one ply after the last of them
+    plies = longest = 0
+    while resolved or exits:
+        newlyResolved = array('L')
+        def update(index):
+            if status[index] != 0:
+                return
+            if plies % 2 == 0: #the successor is lost for the opponent
+                values[index] = encodeResult(WIN, plies + 1)
+            else:
+                movesLeft[index] -= 1
+                if movesLeft[index] != 0:
+                    return
+                values[index] = encodeResult(LOSS, plies + 1)
+            status[index] = 1
+            newlyResolved.append(index)
+        for index in exits.pop(plies, ()):
+            update(index)
+        for index in resolved.pop(plies, ()):
+            squares = []
+            rest = index
+            for i in range(count):
+                rest, sq = divmod(rest, 64)
+                squares.append(sq)
+            squares.reverse()
+            whiteToMove = rest == 0
+            placePieces(gs, pieces, squares, whiteToMove)
+            previousSide = 1 if whiteToMove else 0 #the side that just moved is to move in the previous position
+            for i in range(count):
+                if pieces[i][0] != ('b' if whiteToMove else 'w'):
+                    continue
+                for origin in unmoveSquares(gs, pieces[i], squares[i]):
+                    previous = previousSide
+                    for j in range(count):
+                        previous = previous * 64 + (origin if j == i else squares[j])
+                    if status[previous] != 2:
+                        update(previous)
+            clearPieces(gs, squares)
+        if newlyResolved:
+            resolved[plies + 1] = newlyResolved
+            longest = plies + 1
+        plies += 1
+
+    os.makedirs(TABLEBASE_DIR, exist_ok=True)
+    with open(os.path.join(TABLEBASE_DIR, name + ".bin"), "wb") as f:
+        f.write(values)
+    openTables.pop(name, None)
+    wins = sum(1 for value in values if 0 < value < 128)
+    log("%s: %d positions, %d wins for the side to move, longest mate %d plies, %.1fs" % (name, size - status.count(2), wins, longest, time.perf_counter() - start))
+
+'''
+Tables a capture or promotion in this table leads to, not counting two bare kings
+'''
+def dependencies(name):
+    white, black = ([t.replace("P", "p") for t in part] for part in name.split("v"))
+    reduced = []
+    for mine, theirs, isWhite in ((white, black, True), (black, white, False)):
+        for i in range(1, len(mine)): #any piece but the king can be captured, a pawn can also promote
+            rest = mine[:i] + mine[i + 1:]
+            options = [rest] if len(rest) + len(theirs) > 2 else []
+            if mine[i] == 'p':
+                options.append(rest + ['Q'])
+            for option in options:
+                whiteTypes, blackTypes = (option, theirs) if isWhite else (theirs, option)
+                if isFlipped(whiteTypes, blackTypes):
+                    whiteTypes, blackTypes = blackTypes, whiteTypes
+                reduced.append(tableName(whiteTypes, blackTypes))
+    return reduced
+
+'''
+Generate a table, and before it every smaller table it depends on that doesn't exist yet
+'''
+def generateWithDependencies(name, log=print):
+    for dependency in dependencies(name):
+        if getTable(dependency) is None:
+            generateWithDependencies(dependency, log)
+    if getTable(name) is None:
+        generateTable(name, log)
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases by retrograde analysis.")
+    parser.add_argument("tables", nargs="*", default=THREE_PIECE_TABLES, help="tables to build, e.g. KQvK KRvKB (default: every 3-piece table)")
+    parser.add_argument("--force", action="store_true", help="rebuild tables that already exist")
+    args = parser.parse_args(argv)
+    for name in args.tables:
+        whiteTypes, blackTypes = ([t.replace("P", "p") for t in part] for part in name.split("v"))
+        if whiteTypes[:1] != ["K"] or blackTypes[:1] != ["K"] or len(whiteTypes) + len(blackTypes) > MAX_PIECES:
+            parser.error("%s is not a table of at most %d pieces like KQvK" % (name, MAX_PIECES))
+        if isFlipped(whiteTypes, blackTypes):
+            name = tableName(blackTypes, whiteTypes)
+        if args.force:
+            path = os.path.join(TABLEBASE_DIR, name + ".bin")
+            if os.path.exists(path):
+                os.remove(path)
+            openTables.pop(name, None)
+        generateWithDependencies(name)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())